@@ -0,0 +1,189 @@
+import gc
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import subprocess
+import tracemalloc
+from pathlib import Path
+from datetime import datetime
+
+import fixsongs
+from make_sample_library import make_sample_library
+
+
+def copy_song_book(song_book):
+    return {artist: list(songs) for artist, songs in song_book.items()}
+
+
+def timed(results, name, function, *args):
+    start = time.perf_counter()
+    value = function(*args)
+    results[name] = time.perf_counter() - start
+    return value
+
+
+def run_components(lib_dir, jobs):
+    """Time template matching and each cleaning step separately, in a fresh process so caches start cold."""
+    results = {}
+    file_paths = list(fixsongs.find_music_files(lib_dir))
+    timed(results, "scan", lambda: list(fixsongs.find_music_files(lib_dir)))
+    timed(results, "templates", lambda: [fixsongs.eval_templates(path) for path in file_paths])
+    song_book, _ = timed(results, "parse", fixsongs.read_song_book_from_dir, lib_dir, jobs)
+    song_book = {artist: songs for artist, songs in song_book.items() if songs}
+    timed(results, "fix_the", fixsongs.fix_artist_missing_the, copy_song_book(song_book))
+    timed(results, "merge", fixsongs.merge_similar_typo_artists, copy_song_book(song_book))
+    timed(results, "flip", fixsongs.fix_song_artist_flipped, copy_song_book(song_book))
+    timed(results, "remove_similar", fixsongs.flatten_song_book, song_book)
+    return {"files": len(file_paths), "artists": len(song_book), "component_seconds": results}
+
+
+def traced_bytes_after_clearing_caches():
+    for function in [
+        fixsongs.clean_words,
+        fixsongs.normalize_artist,
+        fixsongs.normalize_title,
+        fixsongs.remove_all_flags,
+        fixsongs.cached_titlecase,
+    ]:
+        function.cache_clear()
+    fixsongs.short_hash_cache.clear()
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+
+def run_memory(lib_dir):
+    """Measure how much memory parsed entries hold, as SongEntry objects and packed into a SongStore."""
+    file_paths = list(fixsongs.find_music_files(lib_dir))
+    tracemalloc.start()
+    entries = [fixsongs.parse_song_file(path) for path in file_paths]
+    entry_bytes = traced_bytes_after_clearing_caches()
+    store = fixsongs.SongStore(entries)
+    del entries
+    store_bytes = traced_bytes_after_clearing_caches()
+    tracemalloc.stop()
+    return {
+        "entry_bytes": entry_bytes,
+        "store_bytes": store_bytes,
+        "entry_bytes_per_file": entry_bytes / len(file_paths),
+        "store_bytes_per_file": store_bytes / len(file_paths),
+    }
+
+
+def run_pipeline(lib_dir, dest_dir, jobs, link_mode):
+    """Run the whole pipeline once with --profile and return its per-stage report."""
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    args = fixsongs.build_parser().parse_args(
+        [str(lib_dir), str(dest_dir), "--flip", "--merge", "--profile", "--jobs", str(jobs), "--link-mode", link_mode]
+    )
+    start = time.perf_counter()
+    fixsongs.run_fix_songs(args)
+    total = time.perf_counter() - start
+    report_path = max((Path(dest_dir) / fixsongs.SONG_BOOK_DIR).glob("profile-*.json"))
+    with open(report_path) as report_file:
+        report = json.load(report_file)
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    return {"total_seconds": total, "counts": report["counts"], "stages": report["stages"]}
+
+
+def run_child(mode, lib_dir, dest_dir, jobs, link_mode):
+    # Each measurement runs in its own interpreter, so peak memory belongs to that size alone
+    command = [sys.executable, __file__, "--child", mode, "--lib-dir", str(lib_dir), "--dest-dir", str(dest_dir)]
+    command += ["--jobs", str(jobs), "--link-mode", link_mode]
+    output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark_size(size, work_dir, seed, jobs, link_mode):
+    lib_dir = Path(work_dir) / f"lib-{size}-{seed}"
+    if not lib_dir.exists():
+        start = time.perf_counter()
+        make_sample_library(lib_dir, size, seed)
+        print(f"Generated {size} files in {time.perf_counter() - start:.1f}s")
+    result = {"size": size, "seed": seed, "jobs": jobs, "link_mode": link_mode}
+    result.update(run_child("components", lib_dir, None, jobs, link_mode))
+    result.update(run_child("memory", lib_dir, None, jobs, link_mode))
+    result.update(run_child("pipeline", lib_dir, Path(work_dir) / f"out-{size}-{seed}", jobs, link_mode))
+    result["files_per_second"] = result["files"] / result["total_seconds"]
+    result["peak_rss_bytes"] = max(stage["process_peak_rss_so_far_bytes"] or 0 for stage in result["stages"].values())
+    return result
+
+
+def print_result(result):
+    print(f"{result['size']} files, {result['artists']} artists, {result['jobs']} jobs")
+    print(f"  end to end: {result['total_seconds']:.2f}s, {result['files_per_second']:.0f} files/s, peak {result['peak_rss_bytes'] / 2**20:.0f} MiB")
+    for name, stage in result["stages"].items():
+        print(f"  stage {name:<10} {stage['wall_seconds']:8.2f}s wall {stage['cpu_seconds'] + stage['worker_cpu_seconds']:8.2f}s cpu")
+    for name, seconds in result["component_seconds"].items():
+        print(f"  step  {name:<15} {seconds:8.2f}s")
+    print(f"  entries hold {result['entry_bytes_per_file']:.0f} bytes per file, {result['store_bytes_per_file']:.0f} packed in a SongStore")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark fixsongs.py on generated libraries of different sizes.")
+    parser.add_argument(
+        "sizes",
+        nargs="*",
+        type=int,
+        default=[10000, 100000],
+        help="Library sizes, in files, to benchmark",
+    )
+    parser.add_argument(
+        "--work-dir",
+        default="bench-lib",
+        help="Folder for the generated libraries, which are kept and reused between runs",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed for the generated libraries",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=fixsongs.positive_int,
+        default=1,
+        help="Number of workers passed on to fixsongs.py",
+    )
+    parser.add_argument(
+        "--link-mode",
+        choices=fixsongs.LINK_MODES,
+        default="copy",
+        help="Link mode passed on to fixsongs.py",
+    )
+    parser.add_argument(
+        "--output",
+        default="bench_output.txt",
+        help="File that each result gets appended to as a line of JSON",
+    )
+    parser.add_argument("--child", choices=["components", "memory", "pipeline"], default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--lib-dir", default=None, help=argparse.SUPPRESS)
+    parser.add_argument("--dest-dir", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child == "components":
+        print(json.dumps(run_components(args.lib_dir, args.jobs)))
+        return
+    if args.child == "memory":
+        print(json.dumps(run_memory(args.lib_dir)))
+        return
+    if args.child == "pipeline":
+        # Keep the console quiet so the last line printed is the result
+        sys.stdout = open(os.devnull, "w")
+        result = run_pipeline(args.lib_dir, args.dest_dir, args.jobs, args.link_mode)
+        sys.stdout = sys.__stdout__
+        print(json.dumps(result))
+        return
+
+    for size in args.sizes:
+        result = benchmark_size(size, args.work_dir, args.seed, args.jobs, args.link_mode)
+        result["date"] = datetime.now().isoformat(timespec="seconds")
+        print_result(result)
+        with open(args.output, "a") as output_file:
+            output_file.write(json.dumps(result) + "\n")
+
+
+if __name__ == "__main__":
+    main()
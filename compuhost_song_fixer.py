@@ -1,16 +1,38 @@
 import os
-import sys
+import queue
+import threading
 import tkinter as tk
-from tkinter import filedialog, scrolledtext
-from fixsongs import run_fix_songs
+from tkinter import filedialog, scrolledtext, ttk
+from logging.handlers import QueueHandler
+from fixsongs import Cancelled, build_parser, progress, run_fix_songs
+
+# How often the window picks up new log lines, and how many lines it keeps
+POLL_INTERVAL_MS = 100
+MAX_LOG_LINES = 5000
+MAX_LINES_PER_POLL = 2000
+
+log_queue = queue.Queue()
+worker = None
 
 def browse_directory(entry_field):
     directory = filedialog.askdirectory()
     entry_field.delete(0, tk.END)  # Clear the entry field
     entry_field.insert(0, directory)  # Insert the selected directory
 
-# Function to run the script and display output
+# Runs on the worker thread, so the window stays responsive while the library is fixed
+def fix_library(args):
+    try:
+        run_fix_songs(args, QueueHandler(log_queue))
+    except Cancelled:
+        log_queue.put("Cancelled\n")
+    except Exception as e:
+        log_queue.put(f"Error: {str(e)}\n")
+    else:
+        log_queue.put("Done\n")
+
+# Function to start the script on a worker thread
 def run_script():
+    global worker
     dir1 = dir1_entry.get()
     dir2 = dir2_entry.get()
 
@@ -18,37 +40,82 @@ def run_script():
         output_text.insert(tk.END, "Please select valid directories!\n")
         return
 
-    try:
-        # Redirect stdout and stderr to output_text
-        sys.stdout = TextRedirector(output_text)
-        sys.stderr = TextRedirector(output_text)  # Also capture errors
-
-        # Now any print() in fixsongs.py or the main script will go to the text widget.
-        run_fix_songs(dir1, dir2)
-
-    except Exception as e:
-        output_text.insert(tk.END, f"Error: {str(e)}\n")
-
-    finally:
-        # Return stdout and stderr to default behavior (console)
-        sys.stdout = sys.__stdout__
-        sys.stderr = sys.__stderr__
-
-class TextRedirector:
-    def __init__(self, widget, tag="stdout"):
-        self.widget = widget
-        self.tag = tag
-
-    def write(self, message):
-        self.widget.insert(tk.END, message)
-        self.widget.see(tk.END)  # Scroll to the end
-
-    def flush(self):
-        pass  # Needed for Python 3 compatibility
+    args = build_parser().parse_args([dir1, dir2])
+    progress.cancelled.clear()
+    worker = threading.Thread(target=fix_library, args=(args,))
+    worker.start()
+    run_button.config(state=tk.DISABLED)
+    cancel_button.config(state=tk.NORMAL)
+
+def cancel_script():
+    progress.cancel()
+    cancel_button.config(state=tk.DISABLED)
+
+def take_log_lines():
+    lines = []
+    while len(lines) < MAX_LINES_PER_POLL:
+        try:
+            item = log_queue.get_nowait()
+        except queue.Empty:
+            break
+        # Log records from fixsongs, or plain strings from fix_library
+        lines.append(item if isinstance(item, str) else item.getMessage() + "\n")
+    return lines
+
+# Adds the lines logged since the last poll in one go and updates the progress bar
+def poll_worker():
+    lines = take_log_lines()
+    if lines:
+        output_text.insert(tk.END, "".join(lines))
+        # Drop the oldest lines so the widget does not keep growing
+        line_count = int(output_text.index("end-1c").split(".")[0])
+        if line_count > MAX_LOG_LINES:
+            output_text.delete("1.0", f"{line_count - MAX_LOG_LINES + 1}.0")
+        output_text.see(tk.END)
+
+    if worker is not None:
+        update_progress()
+        if not worker.is_alive() and log_queue.empty():
+            finish_run()
+    app.after(POLL_INTERVAL_MS, poll_worker)
+
+def update_progress():
+    stage, done, total = progress.stage, progress.done, progress.total
+    if total:
+        progress_bar.stop()
+        progress_bar.config(mode="determinate", maximum=total, value=done)
+        status_label.config(text=f"{stage}: {done}/{total} files")
+    else:
+        # No total while files are still being found, so just show that something is happening
+        if progress_bar["mode"] != "indeterminate":
+            progress_bar.config(mode="indeterminate")
+            progress_bar.start()
+        status_label.config(text=f"{stage}: {done} files" if stage else "Working")
+    if progress.cancelled.is_set():
+        status_label.config(text="Stopping, waiting for the files being copied")
+
+def finish_run():
+    global worker
+    worker = None
+    progress_bar.stop()
+    progress_bar.config(mode="determinate", value=0)
+    status_label.config(text="")
+    run_button.config(state=tk.NORMAL)
+    cancel_button.config(state=tk.DISABLED)
+
+def close_app():
+    # Cancelling stops the run between files, the window only closes once the worker got there
+    progress.cancel()
+    if worker is not None and worker.is_alive():
+        cancel_button.config(state=tk.DISABLED)
+        app.after(POLL_INTERVAL_MS, close_app)
+        return
+    app.destroy()
 
 # Create the main application window
 app = tk.Tk()
 app.title("Compuhost Library Fixer")
+app.protocol("WM_DELETE_WINDOW", close_app)
 
 # Input field for first directory
 tk.Label(app, text="Source Directory:").grid(row=0, column=0, padx=5, pady=5)
@@ -62,13 +129,24 @@ dir2_entry = tk.Entry(app, width=50)
 dir2_entry.grid(row=1, column=1, padx=5, pady=5)
 tk.Button(app, text="Browse", command=lambda: browse_directory(dir2_entry)).grid(row=1, column=2, padx=5, pady=5)
 
-# Run button to execute the script
-run_button = tk.Button(app, text="Run", command=run_script)
-run_button.grid(row=2, column=1, pady=10)
+# Run and cancel buttons
+button_frame = tk.Frame(app)
+button_frame.grid(row=2, column=1, pady=10)
+run_button = tk.Button(button_frame, text="Run", command=run_script)
+run_button.pack(side=tk.LEFT, padx=5)
+cancel_button = tk.Button(button_frame, text="Cancel", command=cancel_script, state=tk.DISABLED)
+cancel_button.pack(side=tk.LEFT, padx=5)
+
+# Progress of the current stage
+progress_bar = ttk.Progressbar(app, length=400, mode="determinate")
+progress_bar.grid(row=3, column=0, columnspan=3, padx=10, sticky="ew")
+status_label = tk.Label(app, text="")
+status_label.grid(row=4, column=0, columnspan=3, padx=10)
 
 # Text area to display output
 output_text = scrolledtext.ScrolledText(app, height=10, width=80)
-output_text.grid(row=3, column=0, columnspan=3, padx=10, pady=10)
+output_text.grid(row=5, column=0, columnspan=3, padx=10, pady=10)
 
 # Run the main event loop
+app.after(POLL_INTERVAL_MS, poll_worker)
 app.mainloop()
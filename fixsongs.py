@@ -3,14 +3,51 @@ import shutil
 import hashlib
 import argparse
 import re
-import glob
 import json
+import sqlite3
+import sys
+import logging
+import multiprocessing
+import time
+import threading
+import struct
+import array
+import zipfile
+import zlib
+import cProfile
+import ctypes
+import ctypes.util
+import select
+import gzip
 import Levenshtein
 from titlecase import titlecase
-from collections import defaultdict
-from pathlib import Path
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path, PurePosixPath
 from archivefile import ArchiveFile
 from enum import Enum
+from functools import lru_cache
+from contextlib import contextmanager
+from datetime import datetime
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger("fixsongs")
 
 DID = r"(?P<DiscID>[A-Za-z0-9]+)"
 DIDUPPER = r"(?P<DiscID>[A-Z0-9-]+)"
@@ -105,7 +142,293 @@ def get_global_varname(val):
     return val
 
 
+class TemplateMatcher:
+    """Finds the first matching template for a file name in a single regex pass."""
+
+    def __init__(self, templates):
+        self.templates = templates
+        self.names = [get_global_varname(template) for template in templates]
+        # Each template becomes a named branch T<index>, with its groups prefixed so they stay unique.
+        # Alternation tries branches in order, so the first branch to match is the first matching template.
+        branches = []
+        for index, template in enumerate(templates):
+            source = template.pattern.replace("(?P<", f"(?P<T{index}_")
+            branches.append(f"(?P<T{index}>{source})")
+        self.pattern = re.compile("|".join(branches))
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.hits = Counter()
+        self.misses = 0
+        self.seconds = 0.0
+
+    def take_stats(self):
+        stats = (self.hits, self.misses, self.seconds)
+        self.reset_stats()
+        return stats
+
+    def add_stats(self, stats):
+        hits, misses, seconds = stats
+        self.hits.update(hits)
+        self.misses += misses
+        self.seconds += seconds
+
+    def match(self, text):
+        start = time.perf_counter()
+        match = self.pattern.match(text)
+        self.seconds += time.perf_counter() - start
+        if not match:
+            self.misses += 1
+            return None, None
+        index = int(match.lastgroup[1:])
+        self.hits[self.names[index]] += 1
+        prefix = f"T{index}_"
+        groups = {name[len(prefix) :]: value for name, value in match.groupdict().items() if name.startswith(prefix)}
+        return self.templates[index], groups
+
+    def log_stats(self):
+        total = sum(self.hits.values()) + self.misses
+        logger.info(f"Template matching took {self.seconds:.3f}s for {total} files")
+        for name in self.names:
+            logger.info(f"  {name}: {self.hits[name]}")
+        logger.info(f"  no template: {self.misses}")
+
+
+template_matcher = TemplateMatcher(all_templates)
+# Entries keep the position of their template in all_templates rather than the pattern itself
+template_indexes = {template: index for index, template in enumerate(all_templates)}
+
+# Per-file records are buffered and written to the log file in batches
+LOG_BUFFER_SIZE = 1000
+PROGRESS_KINDS = ["parsed", "broken", "copied", "archived", "skipped", "errored"]
+
+
+def setup_logging(log_path=None, verbose=False, console_handler=None):
+    """Log summaries to the console and everything, including per-file detail, to log_path.
+
+    console_handler replaces the stdout handler, for callers that show the log somewhere else.
+    """
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        target = getattr(handler, "target", None)
+        handler.close()
+        if target:
+            target.close()
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+    console_handler = console_handler or logging.StreamHandler(sys.stdout)
+    console_handler.setLevel(logging.DEBUG if verbose else logging.INFO)
+    logger.addHandler(console_handler)
+    if log_path:
+        Path(log_path).parent.mkdir(parents=True, exist_ok=True)
+        file_handler = logging.FileHandler(log_path, encoding="utf-8")
+        file_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(message)s"))
+        logger.addHandler(MemoryHandler(LOG_BUFFER_SIZE, flushLevel=logging.ERROR, target=file_handler))
+
+
+def flush_logging():
+    for handler in logger.handlers:
+        handler.flush()
+
+
+def log_to_queue(log_queue):
+    # Runs in worker processes, their records are handled by the parent process
+    logger.handlers.clear()
+    logger.addHandler(QueueHandler(log_queue))
+    logger.setLevel(logging.DEBUG)
+    logger.propagate = False
+
+
+class Cancelled(Exception):
+    pass
+
+
+class Progress:
+    """Counts handled files and logs a progress line at most once per interval.
+
+    A run can be cancelled from another thread, it stops at the next check_cancelled.
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.reset()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def check_cancelled(self):
+        if self.cancelled.is_set():
+            raise Cancelled("Run cancelled")
+
+    def reset(self):
+        self.counts = Counter()
+        self.start_stage("")
+
+    def start_stage(self, stage, total=None):
+        with self.lock:
+            self.stage = stage
+            self.total = total
+            self.done = 0
+            self.bytes = 0
+            self.started = self.last_report = time.monotonic()
+
+    def add(self, kind, size=0):
+        with self.lock:
+            self.counts[kind] += 1
+            self.done += 1
+            self.bytes += size
+            now = time.monotonic()
+            if now - self.last_report >= self.interval:
+                self.last_report = now
+                self.report(now)
+
+    def finish_stage(self):
+        with self.lock:
+            self.report(time.monotonic())
+
+    def report(self, now):
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.done / elapsed
+        line = f"{self.stage}: {self.done}{f'/{self.total}' if self.total else ''} files, {rate:.0f} files/s, {self.bytes / elapsed / 1e6:.1f} MB/s"
+        if self.total and rate:
+            line += f", ETA {(self.total - self.done) / rate:.0f}s"
+        counts = ", ".join(f"{kind} {self.counts[kind]}" for kind in PROGRESS_KINDS)
+        logger.info(f"{line} | {counts}")
+
+
+progress = Progress()
+
+PROFILE_STAGES = ["parse", "pair_cdg", "clean", "dedup", "place", "cleanup", "catalog"]
+
+
+def read_process_io():
+    # Bytes this process read and wrote, only available on Linux
+    try:
+        with open("/proc/self/io", "r") as io_file:
+            fields = dict(line.split(": ") for line in io_file.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+
+def peak_rss_bytes(who):
+    if resource is None:
+        return None
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    peak = resource.getrusage(who).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def reset_stage_peak_rss():
+    # Linux lets a process reset its own peak resident size, which gives each stage its own peak
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def read_stage_peak_rss():
+    # Peak resident size since the last reset_stage_peak_rss
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    return None
+
+
+class StageProfiler:
+    """Records wall time, CPU time, I/O and peak memory for each stage of a run."""
+
+    def __init__(self, enabled=False, cprofile_stage=None):
+        self.enabled = enabled
+        self.cprofile_stage = cprofile_stage
+        self.stages = {}
+        self.profiles = {}
+
+    @contextmanager
+    def stage(self, name):
+        progress.check_cancelled()
+        if not self.enabled:
+            yield
+            return
+        start_wall = time.perf_counter()
+        start_times = os.times()
+        start_read, start_written = read_process_io()
+        peak_reset = reset_stage_peak_rss()
+        profile = cProfile.Profile() if name == self.cprofile_stage else None
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+                self.profiles[name] = profile
+            end_times = os.times()
+            end_read, end_written = read_process_io()
+            self.stages[name] = {
+                "wall_seconds": time.perf_counter() - start_wall,
+                "cpu_seconds": (end_times.user + end_times.system) - (start_times.user + start_times.system),
+                # Worker processes only count once they have exited, which the pools do by the end of a stage
+                "worker_cpu_seconds": (end_times.children_user + end_times.children_system)
+                - (start_times.children_user + start_times.children_system),
+                "bytes_read": end_read - start_read if start_read is not None else None,
+                "bytes_written": end_written - start_written if start_written is not None else None,
+                "peak_rss_bytes": read_stage_peak_rss() if peak_reset else None,
+                # Where the peak cannot be reset, only the peak of the whole run up to the end of this stage is known
+                "process_peak_rss_so_far_bytes": peak_rss_bytes(resource.RUSAGE_SELF) if resource else None,
+                "worker_peak_rss_so_far_bytes": peak_rss_bytes(resource.RUSAGE_CHILDREN) if resource else None,
+            }
+            logger.info(f"Stage {name} took {self.stages[name]['wall_seconds']:.2f}s")
+
+    def write_report(self, report_dir, args):
+        if not self.enabled:
+            return
+        report_dir = Path(report_dir)
+        report_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        report_path = report_dir / f"profile-{stamp}.json"
+        report = {
+            "started": stamp,
+            "arguments": dict(vars(args)),
+            "counts": dict(progress.counts),
+            "stages": self.stages,
+        }
+        with open(report_path, "w") as report_file:
+            json.dump(report, report_file, indent=2, default=str)
+        logger.info(f"Wrote profile report to {report_path}")
+        for name, profile in self.profiles.items():
+            profile_path = report_dir / f"profile-{stamp}-{name}.prof"
+            profile.dump_stats(profile_path)
+            logger.info(f"Wrote cProfile stats for {name} to {profile_path}")
+
+
 class SongEntry:
+    # Libraries run to millions of entries, so there is no per-instance __dict__
+    __slots__ = (
+        "discid",
+        "trackno",
+        "artist",
+        "title",
+        "template_index",
+        "file_ext",
+        "current_file_name",
+        "_fallback_file_name",
+        "current_dir",
+        "_new_file_name",
+    )
+    # new_file_name is built from these, so setting any of them drops the cached name
+    NAME_FIELDS = frozenset(["discid", "trackno", "artist", "title"])
+    # The same artists, folders, discs and extensions repeat across many entries, so each is kept once
+    INTERNED_FIELDS = frozenset(["discid", "trackno", "artist", "file_ext", "current_dir"])
+
     def __init__(
         self,
         discid,
@@ -120,10 +443,11 @@ class SongEntry:
     ):
         self.artist = artist.strip(" ") if artist else None
         self.title = title.strip(" ") if title else None
-        self.template = template
+        self.template_index = template_indexes[template] if template is not None else None
         self.file_ext = file_ext.lower()
         self.current_file_name = current_file_name
-        self.fallback_file_name = fallback_file_name
+        # Most file names need no cleaning, so the cleaned name is only kept when it differs
+        self._fallback_file_name = fallback_file_name if fallback_file_name != current_file_name else None
         self.current_dir = current_dir
         self.trackno = str(int(trackno)).zfill(2) if trackno else "01"
         if discid is None:
@@ -132,6 +456,21 @@ class SongEntry:
             discid = "XX" + discid
         self.discid = discid.replace("-", "").upper()
 
+    def __setattr__(self, name, value):
+        if name in SongEntry.NAME_FIELDS:
+            object.__setattr__(self, "_new_file_name", None)
+        if name in SongEntry.INTERNED_FIELDS and value:
+            value = sys.intern(value)
+        object.__setattr__(self, name, value)
+
+    @property
+    def template(self):
+        return all_templates[self.template_index] if self.template_index is not None else None
+
+    @property
+    def fallback_file_name(self):
+        return self._fallback_file_name if self._fallback_file_name is not None else self.current_file_name
+
     def old_path(self):
         return Path(self.current_dir) / f"{self.current_file_name}{self.file_ext}"
 
@@ -140,7 +479,9 @@ class SongEntry:
 
     def new_file_name(self):
         if self.title and self.artist and self.trackno and self.discid:
-            return f"{self.discid.strip()}-{self.trackno.strip()} - {titlecase(self.artist).strip()} - {titlecase(self.title).strip()}"
+            if self._new_file_name is None:
+                self._new_file_name = f"{self.discid.strip()}-{self.trackno.strip()} - {cached_titlecase(self.artist).strip()} - {cached_titlecase(self.title).strip()}"
+            return self._new_file_name
         else:
             return self.fallback_file_name
 
@@ -157,23 +498,93 @@ class SongEntry:
         return f" discid: {self.discid}, trackno: {self.trackno}, artist: {self.artist}, title: {self.title}, template: {get_global_varname(self.template)}, current file name: {self.current_file_name}, new file name: {self.fallback_file_name}, current dir: {self.current_dir}"
 
 
-def name_cdg_to_mp3(songs: list[SongEntry]) -> None:
-    # Create a dictionary to map base names of .mp3 files (without extension) to their discids
-    mp3s = {entry.old_path().stem: entry.discid for entry in songs if entry.file_ext == ".mp3"}
+class SongStore:
+    """Array-backed list of entries: each field is a column of ids into one shared UTF-8 buffer,
+    which is several times smaller than keeping a SongEntry object per file."""
 
-    for entry in songs:
-        # Check if the current entry is a .cdg file
-        if entry.file_ext == ".cdg":
-            # Create the base name for the .cdg file (without extension)
-            base_name = entry.old_path().stem  # Remove .cdg extension
+    FIELDS = ("discid", "trackno", "artist", "title", "file_ext", "current_file_name", "_fallback_file_name", "current_dir")
+    # Fields with few distinct values are stored once each, the rest are appended as they come
+    SHARED_FIELDS = frozenset(["trackno", "artist", "file_ext", "current_dir"])
 
-            # Check if the base name matches an existing .mp3 base name
-            if base_name in mp3s:
-                entry.discid = mp3s[base_name]
-            else:
-                print(f"Failed to match .cdg with .mp3 for {entry.current_file_name}, copying anyways")
+    def __init__(self, entries=()):
+        self.text = bytearray()
+        # String n is text[offsets[n - 1]:offsets[n]], id 0 stands for None
+        self.offsets = array.array("Q", [0])
+        self.shared_ids = {}
+        self.columns = {field: array.array("I") for field in SongStore.FIELDS}
+        self.template_indexes = array.array("b")
+        for entry in entries:
+            self.append(entry)
+
+    def add_string(self, value, shared):
+        if value is None:
+            return 0
+        if shared and value in self.shared_ids:
+            return self.shared_ids[value]
+        # surrogateescape keeps file names that are not valid UTF-8 intact
+        self.text += value.encode("utf-8", "surrogateescape")
+        self.offsets.append(len(self.text))
+        string_id = len(self.offsets) - 1
+        if shared:
+            self.shared_ids[value] = string_id
+        return string_id
+
+    def get_string(self, string_id):
+        if string_id == 0:
+            return None
+        return self.text[self.offsets[string_id - 1] : self.offsets[string_id]].decode("utf-8", "surrogateescape")
+
+    def append(self, entry):
+        for field in SongStore.FIELDS:
+            self.columns[field].append(self.add_string(getattr(entry, field), field in SongStore.SHARED_FIELDS))
+        self.template_indexes.append(entry.template_index if entry.template_index is not None else -1)
+
+    def __len__(self):
+        return len(self.template_indexes)
+
+    def __getitem__(self, index):
+        # Rebuilds the entry field by field, SongEntry.__init__ would hash files again for broken entries
+        entry = object.__new__(SongEntry)
+        for field in SongStore.FIELDS:
+            setattr(entry, field, self.get_string(self.columns[field][index]))
+        template_index = self.template_indexes[index]
+        entry.template_index = template_index if template_index >= 0 else None
+        return entry
+
+    def __iter__(self):
+        return (self[index] for index in range(len(self)))
+
+
+def pair_cdg_files(entries):
+    """Give every .cdg the disc id of the .mp3 with the same name in the same folder.
+
+    Returns the pairs as cdg entry -> mp3 entry, so they can be placed together later on.
+    """
+    mp3s = {(entry.current_dir, entry.current_file_name): entry for entry in entries if entry.file_ext == ".mp3"}
+    pairs = {}
+    for entry in entries:
+        if entry.file_ext != ".cdg":
+            continue
+        mp3 = mp3s.get((entry.current_dir, entry.current_file_name))
+        if mp3 is None:
+            logger.debug(f"Failed to match .cdg with .mp3 for {entry.current_file_name}, copying anyways")
+            continue
+        entry.discid = mp3.discid
+        pairs[entry] = mp3
+    return pairs
+
+
+# Normalization is pure and the same artists and titles repeat across a library, so results are memoized
+NORMALIZE_CACHE_SIZE = 1 << 17
 
 
+# The same artists and titles get titlecased for file names, folders, songs.json and the LaTeX songbook
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
+def cached_titlecase(text):
+    return titlecase(text)
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_artist(name):
     name = name.lower()
     name = clean_words(name)
@@ -183,6 +594,7 @@ def normalize_artist(name):
     return name.strip()
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_title(title):
     title = title.lower()
     title = clean_words(title)
@@ -230,20 +642,32 @@ def fix_the(name, mode: Mode):
         return new_name
 
 
+SPACES_PATTERN = re.compile("[ _]+")
+SPECIAL_CHARACTERS = str.maketrans({"’": "'", "`": "'", "!": None, ".": None, "&": "and", "$": "s"})
+# "in'" at the end of a word becomes "ing", any other apostrophe is removed
+APOSTROPHE_PATTERN = re.compile(r"in'(?= |\Z)|'")
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def clean_words(words):
     words = words.rstrip(",")
-    words = words.replace("_", " ")  # replace underscores with spaces
-    words = re.sub(" +", " ", words).strip()  # remove duplicate spaces
+    # replace underscores with spaces and remove duplicate spaces
+    words = SPACES_PATTERN.sub(" ", words).strip()
     # replace special characters
-    words = words.replace("’", "'").replace("`", "'").replace("!", "").replace(".", "")
-    words = words.replace("&", "and").replace("$", "s")
+    words = words.translate(SPECIAL_CHARACTERS)
     # remove apostrophes
-    words = f" {words} "  # Add spaces to ensure replacements only affect whole words
-    words = words.replace("in' ", "ing ")
-    words = words.replace("'", "")
+    words = APOSTROPHE_PATTERN.sub(lambda match: "" if match.group() == "'" else "ing", words)
     return words.strip()
 
 
+def log_normalization_stats():
+    for function in [clean_words, normalize_artist, normalize_title, remove_all_flags]:
+        info = function.cache_info()
+        lookups = info.hits + info.misses
+        hit_rate = info.hits / lookups if lookups else 0
+        logger.info(f"{function.__name__}: {lookups} lookups, {hit_rate:.1%} cache hits")
+
+
 # Compiling the patterns once
 PATTERNS = {
     "wvocals": re.compile(
@@ -266,10 +690,11 @@ def fix_artist_suffix(entry, pattern, suffix):
 
 
 def remove_suffix(text, pattern, suffix):
-    text = re.sub(pattern, "", text).strip()
+    text = pattern.sub("", text).strip()
     return text
 
 
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def remove_all_flags(text):
     text = remove_suffix(text, PATTERNS["wvocals"], "wvocals")
     text = remove_suffix(text, PATTERNS["duet"], "duet")
@@ -286,39 +711,59 @@ def fix_all_artist_flags(entry):
     return entry
 
 
+def build_title_artist_index(song_book):
+    # Maps every title to the existing artist it would name if it were an artist, normalized once per distinct title
+    title_artist_index = {}
+    for entries in song_book.values():
+        for entry in entries:
+            if entry.title not in title_artist_index:
+                title_artist_index[entry.title] = title_as_artist(entry.title, song_book)
+    return title_artist_index
+
+
+def title_as_artist(title, song_book):
+    norm_artist = normalize_artist(title)
+    norm_artist = remove_all_flags(norm_artist)
+    norm_artist_the = norm_artist + ", the"
+    if norm_artist_the in song_book:
+        return norm_artist_the
+    elif norm_artist in song_book:
+        return norm_artist
+    return None
+
+
+def flip_entry(entry):
+    entry.artist, entry.title = entry.title, entry.artist
+    entry.artist = normalize_artist(entry.artist)
+    entry.title = normalize_title(entry.title)
+    fix_all_artist_flags(entry)
+
+
 def fix_song_artist_flipped(song_book):
     updated_song_book = {}
-    artist_keys = song_book.keys()
+    title_artist_index = build_title_artist_index(song_book)
     for artist, entries in song_book.items():
         songs_are_artist = True
         for entry in entries:
             if entry.title == entry.artist:
                 songs_are_artist = False
                 break
-            norm_artist = normalize_artist(entry.title)
-            norm_artist = remove_all_flags(norm_artist)
-            norm_artist_the = norm_artist + ", the"
-            if norm_artist_the in artist_keys:
-                found = norm_artist_the
-            elif norm_artist in artist_keys:
-                found = norm_artist
-            else:
+            found = title_artist_index[entry.title]
+            if found is None:
                 songs_are_artist = False
                 break
-            if len(song_book[artist]) > len(song_book.get(found, [])):
+            if len(song_book[artist]) > len(song_book[found]):
                 songs_are_artist = False
                 break
 
         if songs_are_artist:
+            logger.debug(f"Flipping {artist}: all {len(entries)} titles are artists with at least as many songs")
             for entry in entries:
-                entry.artist, entry.title = entry.title, entry.artist
-                entry.artist = normalize_artist(entry.artist)
-                entry.title = normalize_title(entry.title)
-                fix_all_artist_flags(entry)
+                flip_entry(entry)
                 if entry.artist not in updated_song_book:
                     updated_song_book[entry.artist] = []
                 updated_song_book[entry.artist].append(entry)
-                print(f"Should be Artist: {entry.artist} Song: {entry.title}")
+                logger.debug(f"Should be Artist: {entry.artist} Song: {entry.title}")
         else:
             updated_song_book[artist] = entries
 
@@ -331,28 +776,27 @@ def merge_similar_typo_artists(song_book):
 
     cleaned_artists = {artist: clean_artist(artist) for artist in song_book.keys()}
     artist_set = set(song_book.keys())
+    # Sets keep their iteration order while items are only removed, so this is the order list(artist_set) would give
+    artist_order = {artist: index for index, artist in enumerate(artist_set)}
+    artist_titles = {artist: {entry.title for entry in song_book[artist]} for artist in song_book.keys()}
+    # Artists only merge when they share at least one title, so candidates come from a title -> artists index
+    title_index = defaultdict(list)
+    for artist, titles in artist_titles.items():
+        for title in titles:
+            title_index[title].append(artist)
     updated_song_book = {}
     while artist_set:
         artist = artist_set.pop()
         same_artists = [artist]
         clean_name = cleaned_artists[artist]
-        to_check = list(artist_set)  # List to avoid modifying the set during iteration
+        titles_artist = artist_titles[artist]
+        shared_titles = Counter(
+            other_artist for title in titles_artist for other_artist in title_index[title] if other_artist in artist_set
+        )
+        to_check = sorted(shared_titles, key=artist_order.__getitem__)
         for other_artist in to_check:
-            clean_other = cleaned_artists[other_artist]
-            # Check if length difference exceeds threshold
-            if abs(len(clean_name) - len(clean_other)) > 0.2 * min(len(clean_name), len(clean_other)):
-                continue
-            # Check for song title overlap
-            titles_artist = {entry.title for entry in song_book[artist]}
-            titles_other = {entry.title for entry in song_book[other_artist]}
-            min_songs = min(len(titles_artist), len(titles_other))
-            common_songs = len(titles_artist.intersection(titles_other))
-            if common_songs / min_songs < 0.3:
-                continue
-            if clean_other.split() == clean_name.split()[::-1]:
-                same_artists.append(other_artist)
-                artist_set.remove(other_artist)
-            elif Levenshtein.distance(clean_name, clean_other) <= 0.2 * len(clean_name):
+            min_songs = min(len(titles_artist), len(artist_titles[other_artist]))
+            if is_typo_artist(clean_name, cleaned_artists[other_artist], shared_titles[other_artist], min_songs):
                 same_artists.append(other_artist)
                 artist_set.remove(other_artist)
         combined_songs = {song for artist in same_artists for song in song_book[artist]}
@@ -360,17 +804,29 @@ def merge_similar_typo_artists(song_book):
         for entry in combined_songs:
             entry.artist = max_artist
         if len(same_artists) > 1:
-            print(f"combining {max_artist} < {same_artists}", flush=True)
+            logger.debug(f"combining {max_artist} < {same_artists}")
         updated_song_book[max_artist] = list(combined_songs)
     return updated_song_book
 
 
+def is_typo_artist(clean_name, clean_other, common_songs, min_songs):
+    # Check if length difference exceeds threshold
+    if abs(len(clean_name) - len(clean_other)) > 0.2 * min(len(clean_name), len(clean_other)):
+        return False
+    # Check for song title overlap
+    if common_songs / min_songs < 0.3:
+        return False
+    if clean_other.split() == clean_name.split()[::-1]:
+        return True
+    return Levenshtein.distance(clean_name, clean_other) <= 0.2 * len(clean_name)
+
+
 def fix_artist_missing_the(song_book):
     for artist in list(song_book.keys()):
         variant_artist = f"{artist}, the"
         if variant_artist in song_book:
             for entry in song_book[artist]:
-                print(f"adding ', the' to {entry.artist}", flush=True)
+                logger.debug(f"adding ', the' to {entry.artist}")
                 entry.artist += ", the"
             song_book[variant_artist].extend(song_book[artist])
             del song_book[artist]
@@ -379,8 +835,8 @@ def fix_artist_missing_the(song_book):
 
 def clean_song_book(song_book, flip=True, merge=True):
     original_count = len(song_book)
-    print(f"Song Book has {original_count} artists", flush=True)
-    print(f"Song Book has: {sum(len(songs) for songs in song_book.values())} songs", flush=True)
+    logger.info(f"Song Book has {original_count} artists")
+    logger.info(f"Song Book has: {sum(len(songs) for songs in song_book.values())} songs")
     updated_song_book = {artist: songs for artist, songs in song_book.items() if songs}
     updated_song_book = fix_artist_missing_the(updated_song_book)
     if merge:
@@ -391,8 +847,9 @@ def clean_song_book(song_book, flip=True, merge=True):
     if merge:
         updated_song_book = merge_similar_typo_artists(updated_song_book)
     final_count = len(updated_song_book)
-    print(f"Updated Song Book has {final_count} artists", flush=True)
-    print(f"Updated Song Book has: {sum(len(songs) for songs in updated_song_book.values())} songs", flush=True)
+    logger.info(f"Updated Song Book has {final_count} artists")
+    logger.info(f"Updated Song Book has: {sum(len(songs) for songs in updated_song_book.values())} songs")
+    log_normalization_stats()
     return updated_song_book
 
 
@@ -424,36 +881,30 @@ def make_entry_from_template(file_path):
     text = os.path.basename(text)
     cleaned = clean_words(text)
 
-    for template in all_templates:
-        match = re.match(template, cleaned)
-        if match:
-            if (
-                not match.groupdict().get("Artist")
-                or not match.groupdict().get("Artist").strip()
-                or not match.groupdict().get("Title")
-                or not match.groupdict().get("Title").strip()
-            ):
-                break
-            entry = SongEntry(
-                discid=match.groupdict().get("DiscID"),
-                trackno=match.groupdict().get("TrackNo"),
-                artist=match.group("Artist").strip(),
-                title=match.group("Title").strip(),
-                template=template,
-                file_ext=ext,
-                current_file_name=text,
-                fallback_file_name=cleaned,
-                current_dir=dir_name,
-            )
-            clean_file_name = entry.fallback_file_name
-            # Adjust file name based on certain conditions
-            if clean_file_name.startswith("XX"):
-                clean_file_name = clean_file_name[11:]
-            # Break if the file name reduction is too large
-            if len(file_name) / len(clean_file_name) < 0.75:
-                break
-            return entry
-    return None
+    template, groups = template_matcher.match(cleaned)
+    if template is None:
+        return None
+    if not groups.get("Artist") or not groups["Artist"].strip() or not groups.get("Title") or not groups["Title"].strip():
+        return None
+    entry = SongEntry(
+        discid=groups.get("DiscID"),
+        trackno=groups.get("TrackNo"),
+        artist=groups["Artist"].strip(),
+        title=groups["Title"].strip(),
+        template=template,
+        file_ext=ext,
+        current_file_name=text,
+        fallback_file_name=cleaned,
+        current_dir=dir_name,
+    )
+    clean_file_name = entry.fallback_file_name
+    # Adjust file name based on certain conditions
+    if clean_file_name.startswith("XX"):
+        clean_file_name = clean_file_name[11:]
+    # Break if the file name reduction is too large
+    if len(file_name) / len(clean_file_name) < 0.75:
+        return None
+    return entry
 
 
 def make_broken_entry(file_path):
@@ -481,22 +932,174 @@ def eval_templates(file_path):
     return entry
 
 
-def read_song_book_from_dir(root_dir):
+def find_music_files(root_dir):
+    return (dir_entry.path for dir_entry in find_music_entries(root_dir))
+
+
+def find_music_entries(root_dir):
+    # Walks in the same order glob("**") did, but reuses the type info cached on each DirEntry
+    # instead of stat-ing every path, and never descends into the tool's own output folders
+    try:
+        with os.scandir(root_dir) as it:
+            dir_entries = list(it)
+    except OSError:
+        return
+    for dir_entry in dir_entries:
+        name = dir_entry.name
+        if name.startswith("."):
+            continue
+        try:
+            if os.path.splitext(name)[1].lower() in valid_extensions and dir_entry.is_file():
+                yield dir_entry
+            elif name not in SKIPPED_DIRS and dir_entry.is_dir():
+                yield from find_music_entries(dir_entry.path)
+        except OSError:
+            continue
+
+
+def parse_song_file(file_path):
+    entry = eval_templates(file_path)
+    if entry.artist:
+        entry.title = normalize_title(entry.title)
+        entry = fix_all_artist_flags(entry)
+        entry.artist = normalize_artist(entry.artist)
+    return entry
+
+
+def parse_song_files(file_paths):
+    # Runs in a worker process, so a whole chunk is parsed per round trip
+    entries = [parse_song_file(file_path) for file_path in file_paths]
+    return entries, template_matcher.take_stats()
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def add_to_song_book(entry, song_book, broken_song_book):
+    if entry.artist:
+        song_book[entry.artist].append(entry)
+        logger.debug(f"parsed: {entry.new_file_name()} from {entry.fallback_file_name}")
+        progress.add("parsed")
+    else:
+        broken_song_book[""].append(entry)
+        logger.debug(f"could not parse: {entry.fallback_file_name}")
+        progress.add("broken")
+
+
+def parse_song_paths(file_paths, jobs=1, chunk_size=256):
+    if jobs > 1:
+        # Chunks come back in submission order, so entries are yielded in the same order as a serial run
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=set_short_hash_mode, initargs=(short_hash_mode,))
+        try:
+            for entries, stats in executor.map(parse_song_files, chunked(file_paths, chunk_size)):
+                progress.check_cancelled()
+                template_matcher.add_stats(stats)
+                yield from entries
+        finally:
+            # Chunks that have not started are dropped when the run is cancelled
+            executor.shutdown(cancel_futures=True)
+    else:
+        for file_path in file_paths:
+            progress.check_cancelled()
+            yield parse_song_file(file_path)
+
+
+# Bump when parsing or normalization changes so existing song indexes get rebuilt
+SONG_INDEX_VERSION = 1
+SONG_INDEX_FIELDS = [
+    "discid",
+    "trackno",
+    "artist",
+    "title",
+    "file_ext",
+    "current_file_name",
+    "fallback_file_name",
+    "current_dir",
+]
+
+
+def song_index_signature():
+    signature = hashlib.sha256(f"{SONG_INDEX_VERSION}:{short_hash_mode}".encode())
+    for template in all_templates:
+        signature.update(template.pattern.encode())
+    return signature.hexdigest()
+
+
+class SongIndex:
+    """SQLite cache of parsed song entries keyed by path, size and mtime."""
+
+    def __init__(self, index_path):
+        self.connection = sqlite3.connect(index_path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS songs (path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, template INTEGER, "
+            + ", ".join(f"{field} TEXT" for field in SONG_INDEX_FIELDS)
+            + ")"
+        )
+        signature = song_index_signature()
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'signature'").fetchone()
+        if row is None or row[0] != signature:
+            if row is not None:
+                logger.info("Song index is from a different parser, rebuilding it")
+            self.connection.execute("DELETE FROM songs")
+            self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('signature', ?)", (signature,))
+        self.rows = {row[0]: row[1:] for row in self.connection.execute("SELECT * FROM songs")}
+        self.seen = set()
+        self.updates = []
+
+    def lookup(self, path, size, mtime):
+        self.seen.add(path)
+        row = self.rows.get(path)
+        if row is None or row[0] != size or row[1] != mtime:
+            return None
+        template = all_templates[row[2]] if row[2] is not None else None
+        return SongEntry(template=template, **dict(zip(SONG_INDEX_FIELDS, row[3:])))
+
+    def store(self, path, size, mtime, entry):
+        # Snapshot the fields now, entries are edited in place later on
+        self.updates.append((path, size, mtime, entry.template_index, *(getattr(entry, field) for field in SONG_INDEX_FIELDS)))
+
+    def close(self):
+        removed = [(path,) for path in self.rows.keys() - self.seen]
+        placeholders = ", ".join("?" * (3 + 1 + len(SONG_INDEX_FIELDS)))
+        with self.connection:
+            self.connection.executemany(f"INSERT OR REPLACE INTO songs VALUES ({placeholders})", self.updates)
+            self.connection.executemany("DELETE FROM songs WHERE path = ?", removed)
+        self.connection.close()
+        unchanged = len(self.seen) - len(self.updates)
+        logger.info(f"Song index: {unchanged} unchanged, {len(self.updates)} parsed, {len(removed)} removed")
+
+
+def read_indexed_song_entries(root_dir, index, jobs=1, chunk_size=256):
+    slots = []
+    for dir_entry in find_music_entries(root_dir):
+        stat = dir_entry.stat()
+        slots.append((dir_entry.path, stat, index.lookup(dir_entry.path, stat.st_size, stat.st_mtime_ns)))
+    changed_paths = [path for path, _, entry in slots if entry is None]
+    parsed = dict(zip(changed_paths, parse_song_paths(changed_paths, jobs, chunk_size)))
+    for path, stat, entry in slots:
+        if entry is None:
+            entry = parsed[path]
+            index.store(path, stat.st_size, stat.st_mtime_ns, entry)
+        yield entry
+
+
+def read_song_book_from_dir(root_dir, jobs=1, chunk_size=256, index=None):
     song_book = defaultdict(list)
     broken_song_book = defaultdict(list)
-    for file_path in glob.iglob(f"{root_dir}/**", recursive=True):
-        if not os.path.isfile(file_path) or not is_music(file_path):
-            continue
-        entry = eval_templates(file_path)
-        if entry.artist:
-            entry.title = normalize_title(entry.title)
-            entry = fix_all_artist_flags(entry)
-            entry.artist = normalize_artist(entry.artist)
-            song_book[entry.artist].append(entry)
-            print(f"\nparsed:\n {entry.new_file_name()}\n from\n {entry.fallback_file_name}", flush=True)
-        else:
-            broken_song_book[""].append(entry)
-            print(f"\ncould not parse:\n {entry.fallback_file_name}", flush=True)
+    template_matcher.reset_stats()
+    progress.start_stage("Parsing")
+    if index is None:
+        entries = parse_song_paths(find_music_files(root_dir), jobs, chunk_size)
+    else:
+        entries = read_indexed_song_entries(root_dir, index, jobs, chunk_size)
+    for entry in entries:
+        add_to_song_book(entry, song_book, broken_song_book)
+    progress.finish_stage()
+    template_matcher.log_stats()
     return song_book, broken_song_book
 
 
@@ -511,22 +1114,69 @@ def compute_similar_suffix(song1, song2):
 
 
 def remove_similar_songs(songs):
+    # Each title is normalized once. Similar-suffix matches are found through a prefix index and
+    # distances are only computed against kept titles of a compatible length, with an early cutoff.
     cleaned_songs = set()
+    kept_by_length = defaultdict(list)
+    kept_stripped = set()
+    # Prefix of a kept title -> length of the shortest kept title starting with it
+    kept_prefixes = {}
     for song in songs:
         song = song.removesuffix("(remix)").removesuffix("(duet)")
         song = song.removesuffix("(wvocals)").removesuffix("(radio version)")
         song = song.removesuffix("[sc]").removesuffix("(mpx)")
         song = song.strip()
-        if not any(
-            compute_similar_suffix(fix_the(song, Mode.REMOVE), fix_the(other_song, Mode.REMOVE))
-            or Levenshtein.distance(fix_the(song, Mode.REMOVE), fix_the(other_song, Mode.REMOVE))
-            <= 1 + 0.14 * max(len(fix_the(song, Mode.REMOVE)), len(fix_the(other_song, Mode.REMOVE)))
-            for other_song in cleaned_songs
-        ):
-            cleaned_songs.add(song)
+        normalized = fix_the(song, Mode.REMOVE)
+        stripped = normalized.strip()
+        if has_similar_suffix(stripped, kept_stripped, kept_prefixes) or has_close_distance(normalized, kept_by_length):
+            continue
+        cleaned_songs.add(song)
+        kept_by_length[len(normalized)].append(normalized)
+        kept_stripped.add(stripped)
+        for length in range(9, len(stripped) + 1):
+            prefix = stripped[:length]
+            kept_prefixes[prefix] = min(kept_prefixes.get(prefix, len(stripped)), len(stripped))
     return cleaned_songs
 
 
+def has_similar_suffix(song, kept_stripped, kept_prefixes):
+    # Same result as compute_similar_suffix against every kept title
+    length = len(song)
+    # A kept title that starts with this one and is less than twice as long
+    if length > 8 and kept_prefixes.get(song, 2 * length) < 2 * length:
+        return True
+    # A kept title longer than 8 and more than half as long that this one starts with
+    return any(song[:prefix_length] in kept_stripped for prefix_length in range(max(9, length // 2 + 1), length))
+
+
+def has_close_distance(song, kept_by_length):
+    length = len(song)
+    for other_length, others in kept_by_length.items():
+        # The distance is at least the length difference, so whole lengths can be skipped
+        cutoff = int(1 + 0.14 * max(length, other_length))
+        if abs(length - other_length) > cutoff:
+            continue
+        for other_song in others:
+            if Levenshtein.distance(song, other_song, score_cutoff=cutoff) <= cutoff:
+                return True
+    return False
+
+
+def flatten_song_book(song_book, jobs=1):
+    return flatten_titles({artist: {entry.title for entry in song_book[artist]} for artist in song_book}, jobs)
+
+
+def flatten_titles(titles, jobs=1):
+    # Which of two similar titles is kept depends on their order, so titles are sorted first and the same
+    # titles always flatten the same way, and handed over as lists so workers keep that order
+    titles = {artist: sorted(artist_titles) for artist, artist_titles in titles.items()}
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            cleaned = executor.map(remove_similar_songs, titles.values(), chunksize=64)
+            return dict(zip(titles.keys(), cleaned))
+    return {artist: remove_similar_songs(artist_titles) for artist, artist_titles in titles.items()}
+
+
 def write_latex_songbook_to_file(artist_song_dict, output_file_path):
     with open(output_file_path, "w", encoding="utf-8") as file:
         # Write pre-content
@@ -536,13 +1186,13 @@ def write_latex_songbook_to_file(artist_song_dict, output_file_path):
         # Sort artists alphabetically
         sorted_artists = sorted(artist_song_dict.keys())
         for artist in sorted_artists:
-            file.write(f"\\artistsection{{{titlecase(artist)}}}\n")
+            file.write(f"\\artistsection{{{cached_titlecase(artist)}}}\n")
             file.write("\\begin{songlist}\n")
 
             # Sort songs alphabetically for each artist
             sorted_songs = sorted(artist_song_dict[artist])
             for song in sorted_songs:
-                file.write(f"\\item {titlecase(song)}\n")
+                file.write(f"\\item {cached_titlecase(song)}\n")
             file.write("\\end{songlist}\n\n")
 
         # Write post-content
@@ -550,63 +1200,559 @@ def write_latex_songbook_to_file(artist_song_dict, output_file_path):
             file.write(post_file.read())
 
 
-def compute_short_hash(file_path, chunk_size=4096):
+# "full" hashes every byte of a file, "sampled" only its size and a few blocks
+short_hash_mode = "full"
+SAMPLE_BLOCK_SIZE = 1 << 16
+short_hash_cache = {}
+
+
+def set_short_hash_mode(mode):
+    global short_hash_mode
+    short_hash_mode = mode
+
+
+def compute_short_hash(file_path, chunk_size=1 << 20):
+    stat = os.stat(file_path)
+    key = (str(file_path), stat.st_size, stat.st_mtime_ns, short_hash_mode)
+    if key not in short_hash_cache:
+        if short_hash_mode == "sampled":
+            hash_hex = compute_sampled_hash(file_path, stat.st_size)
+        else:
+            hash_hex = compute_full_hash(file_path, chunk_size)
+        # Replace non-alphanumeric characters with 'A'
+        cleaned_hash = re.sub(r"[^a-zA-Z0-9]", "A", hash_hex)
+        short_hash_cache[key] = cleaned_hash[:5]
+    return short_hash_cache[key]
+
+
+def compute_full_hash(file_path, chunk_size):
     hash_sha256 = hashlib.sha256()
     with open(file_path, "rb") as f:
         for chunk in iter(lambda: f.read(chunk_size), b""):
             hash_sha256.update(chunk)
-    hash_hex = hash_sha256.hexdigest()
-    # Replace non-alphanumeric characters with 'A'
-    cleaned_hash = re.sub(r"[^a-zA-Z0-9]", "A", hash_hex)
-    return cleaned_hash[:5]
+    return hash_sha256.hexdigest()
+
+
+def compute_sampled_hash(file_path, size, block_size=SAMPLE_BLOCK_SIZE):
+    # Hash the size plus the head, middle and tail blocks, small files are hashed whole
+    hash_sha256 = hashlib.sha256(size.to_bytes(8, "little"))
+    with open(file_path, "rb") as f:
+        if size <= 3 * block_size:
+            hash_sha256.update(f.read())
+        else:
+            for offset in (0, (size - block_size) // 2, size - block_size):
+                f.seek(offset)
+                hash_sha256.update(f.read(block_size))
+    return hash_sha256.hexdigest()
+
+
+def partial_content_hash(entry):
+    try:
+        path = entry.old_path()
+        return compute_sampled_hash(path, os.stat(path).st_size)
+    except OSError:
+        return None
+
+
+def full_content_hash(entry):
+    try:
+        return compute_full_hash(entry.old_path(), 1 << 20)
+    except OSError:
+        return None
+
+
+def zip_payload_signature(entry):
+    # Cheap to read from the central directory: the extension, CRC and size of every member
+    if entry.file_ext != ".zip":
+        return None
+    try:
+        with zipfile.ZipFile(entry.old_path()) as archive:
+            members = [info for info in archive.infolist() if not info.is_dir()]
+            return tuple(sorted((os.path.splitext(info.filename)[1].lower(), info.CRC, info.file_size) for info in members)) or None
+    except (OSError, zipfile.BadZipFile):
+        return None
+
+
+def zip_payload_hash(entry):
+    try:
+        with zipfile.ZipFile(entry.old_path()) as archive:
+            digests = []
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                hash_sha256 = hashlib.sha256()
+                with archive.open(info) as member:
+                    for chunk in iter(lambda: member.read(1 << 20), b""):
+                        hash_sha256.update(chunk)
+                digests.append((os.path.splitext(info.filename)[1].lower(), hash_sha256.hexdigest()))
+            return tuple(sorted(digests))
+    except (OSError, RuntimeError, NotImplementedError, zipfile.BadZipFile, zlib.error):
+        return None
+
+
+def split_groups(groups, key, jobs=1):
+    """Split groups of entries by key, keeping entry order and only the parts of two or more."""
+    entries = [entry for group in groups for entry in group]
+    # Hashing lets go of the GIL, so threads read and hash several files at once
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        keys = dict(zip(map(id, entries), executor.map(key, entries)))
+    parts = []
+    for group in groups:
+        by_key = defaultdict(list)
+        for entry in group:
+            if keys[id(entry)] is not None:
+                by_key[keys[id(entry)]].append(entry)
+        parts.extend(part for part in by_key.values() if len(part) > 1)
+    return parts
+
+
+def find_duplicate_entries(entries, jobs=1):
+    """Map every entry whose content matches an earlier entry's to that earlier entry.
+
+    Only files of the same size get their sampled hash compared, and only matching sampled
+    hashes get their full hash compared. Zips also match when they hold the same songs packed differently.
+    """
+    by_size = defaultdict(list)
+    for entry in entries:
+        try:
+            by_size[os.stat(entry.old_path()).st_size].append(entry)
+        except OSError:
+            continue
+    groups = [group for group in by_size.values() if len(group) > 1]
+    groups = split_groups(groups, partial_content_hash, jobs)
+    groups = split_groups(groups, full_content_hash, jobs)
+    duplicates = {entry: group[0] for group in groups for entry in group[1:]}
+    zips = [entry for entry in entries if entry.file_ext == ".zip" and entry not in duplicates]
+    groups = split_groups([zips], zip_payload_signature, jobs)
+    groups = split_groups(groups, zip_payload_hash, jobs)
+    duplicates.update({entry: group[0] for group in groups for entry in group[1:]})
+    # Half of a cdg/mp3 pair is only skipped when the other half is too, so no pair gets split up
+    pairs = {(entry.current_dir, entry.current_file_name, entry.file_ext): entry for entry in entries}
+    for entry in list(duplicates):
+        other_ext = {".cdg": ".mp3", ".mp3": ".cdg"}.get(entry.file_ext)
+        partner = pairs.get((entry.current_dir, entry.current_file_name, other_ext))
+        if other_ext and partner is not None and partner not in duplicates:
+            del duplicates[entry]
+    return duplicates
+
+
+def log_duplicates(duplicates):
+    total_size = 0
+    for entry, kept in duplicates.items():
+        logger.debug(f"Duplicate: {entry.old_path()} has the same content as {kept.old_path()}")
+        try:
+            total_size += os.stat(entry.old_path()).st_size
+        except OSError:
+            pass
+    logger.info(f"Found {len(duplicates)} duplicate files holding {total_size / 2**20:.1f} MB")
 
 
 BROKEN_ARCHIVE_DIR = "#Broken Archive"
 TEMP_FOLDER_DIR = "#Temp Folder Delete Me"
 BADLY_NAMED_DIR = "#Badly Named"
+SONG_BOOK_DIR = "#Song Book"
+# Folders this tool writes into its destination, never scanned as part of a library
+SKIPPED_DIRS = {BROKEN_ARCHIVE_DIR, TEMP_FOLDER_DIR, SONG_BOOK_DIR}
 
 
-def rename_and_rearchive(entry, root_dir, delete=False):
-    old_path = entry.old_path()
-    if BROKEN_ARCHIVE_DIR in str(old_path) or TEMP_FOLDER_DIR in str(old_path):
-        return
+def destination_path(entry, root_dir):
     artist_dir = (
-        Path(root_dir) / entry.artist[0].upper() / titlecase(entry.artist.strip()) if entry.artist else Path(root_dir) / BADLY_NAMED_DIR
+        Path(root_dir) / entry.artist[0].upper() / cached_titlecase(entry.artist.strip()) if entry.artist else Path(root_dir) / BADLY_NAMED_DIR
     )
-    new_path = artist_dir / entry.new_file_name_wext()
-    new_path_fallback = Path(root_dir) / BROKEN_ARCHIVE_DIR / entry.new_file_name_wext()
-    temp_dir = Path(root_dir) / TEMP_FOLDER_DIR / entry.new_file_name()
+    return artist_dir / entry.new_file_name_wext()
 
-    if old_path == new_path or str(old_path).lower() == str(new_path).lower():
-        return
 
-    # Create necessary directories
-    if new_path.exists():
-        print(f"\nAlready Exists:\n {old_path} vs\n {new_path}", flush=True)
-    else:
-        for path in [new_path_fallback.parent, new_path.parent, temp_dir]:
+def is_rearchived(entry, old_path, new_path):
+    return entry.file_ext in [".zip", ".rar"] and not new_path.name == old_path.name
+
+
+def make_dirs(paths, made_dirs=None):
+    for path in paths:
+        if made_dirs is None or path not in made_dirs:
             path.mkdir(parents=True, exist_ok=True)
+            if made_dirs is not None:
+                made_dirs.add(path)
+
+
+LINK_MODES = ["copy", "hardlink", "reflink", "auto"]
+# ioctl request that clones a file's extents on btrfs and XFS
+FICLONE = 0x40049409
+
+
+def reflink_file(old_path, new_path):
+    if fcntl is None:
+        raise OSError("reflinks are not supported on this platform")
+    try:
+        with open(old_path, "rb") as source_file, open(new_path, "wb") as target_file:
+            fcntl.ioctl(target_file.fileno(), FICLONE, source_file.fileno())
+    except OSError:
+        Path(new_path).unlink(missing_ok=True)
+        raise
+    shutil.copystat(old_path, new_path)
+
+
+def copy_file_range_file(old_path, new_path):
+    try:
+        with open(old_path, "rb") as source_file, open(new_path, "wb") as target_file:
+            remaining = os.fstat(source_file.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(source_file.fileno(), target_file.fileno(), remaining)
+                if copied == 0:
+                    raise OSError(f"copy_file_range stopped early for {old_path}")
+                remaining -= copied
+    except OSError:
+        Path(new_path).unlink(missing_ok=True)
+        raise
+    shutil.copystat(old_path, new_path)
+
+
+def place_file(old_path, new_path, link_mode="copy"):
+    """Put the contents of old_path at new_path using link_mode and return how it was done."""
+    if link_mode == "hardlink":
+        os.link(old_path, new_path)
+        return "Hardlinked"
+    if link_mode == "reflink":
+        reflink_file(old_path, new_path)
+        return "Reflinked"
+    if link_mode == "auto":
+        attempts = []
+        if os.stat(old_path).st_dev == os.stat(new_path.parent).st_dev:
+            attempts += [(os.link, "Hardlinked"), (reflink_file, "Reflinked")]
+        if hasattr(os, "copy_file_range"):
+            attempts.append((copy_file_range_file, "Copied in kernel"))
+        for place, label in attempts:
+            try:
+                place(old_path, new_path)
+                return label
+            except OSError:
+                continue
+    shutil.copy2(old_path, new_path)
+    return "Copied"
+
+
+class LinkModeError(Exception):
+    pass
+
+
+def check_link_mode(source_dir, root_dir, link_mode):
+    """Link one source file into root_dir, so a hardlink or reflink mode that cannot work stops the run before it starts."""
+    if link_mode not in ["hardlink", "reflink"]:
+        return
+    source = next(find_music_files(source_dir), None)
+    if source is None:
+        return
+    Path(root_dir).mkdir(parents=True, exist_ok=True)
+    probe_path = Path(root_dir) / f".link-mode-check-{os.getpid()}"
+    try:
+        place_file(source, probe_path, link_mode)
+    except OSError as e:
+        raise LinkModeError(f"--link-mode {link_mode} does not work from {source_dir} to {root_dir} ({e}), use copy or auto instead")
+    finally:
+        probe_path.unlink(missing_ok=True)
+
+
+# action is "copy" or "move" to place the source, "exists" when an earlier operation already
+# claimed the destination or placed the same content, or "delete" when that happens and the
+# original gets deleted. partner is the [source, destination] of the other half of a .cdg/.mp3
+# pair placed in the same operation, whichever half came first in entry order is the main one.
+FileOperation = namedtuple("FileOperation", ["action", "archive", "source", "destination", "partner"], defaults=[None])
+
+
+def operation_files(operation):
+    files = [(Path(operation.source), Path(operation.destination))]
+    if operation.partner:
+        files.append((Path(operation.partner[0]), Path(operation.partner[1])))
+    return files
+
+
+def planned_paths(entry, root_dir):
+    # Where an entry goes, or None when it is left where it is
+    old_path = entry.old_path()
+    if BROKEN_ARCHIVE_DIR in str(old_path) or TEMP_FOLDER_DIR in str(old_path):
+        return None
+    new_path = destination_path(entry, root_dir)
+    if old_path == new_path or str(old_path).lower() == str(new_path).lower():
+        return None
+    return old_path, new_path
+
+
+def plan_file_operations(entries, root_dir, delete=False, duplicates=None, cdg_pairs=None):
+    """Decide what happens to every entry, in entry order.
+
+    Destinations are claimed before anything runs, so when two entries share a destination
+    the first one always wins, no matter how the operations are executed later. An entry in
+    duplicates is only skipped once its content has actually been placed, by the entry it maps to
+    or, when that one lost its destination to another entry, by the first of its duplicates that did not.
+    A .cdg and .mp3 from cdg_pairs that are both placed become one operation.
+    """
+    operations = []
+    claimed = set()
+    duplicates = duplicates or {}
+    # Kept entry of each duplicate group -> where its content ends up in the library
+    placed_content = {}
+    partners = {}
+    if cdg_pairs:
+        planned = set(entries)
+        for cdg, mp3 in cdg_pairs.items():
+            if cdg in planned and mp3 in planned:
+                partners[cdg] = mp3
+                partners[mp3] = cdg
+    paired = set()
+    for entry in entries:
+        if entry in paired:
+            continue
+        kept = duplicates.get(entry, entry)
+        paths = planned_paths(entry, root_dir)
+        if paths is None:
+            # Already in its place, unless it sits in one of the tool's own folders
+            old_path = entry.old_path()
+            if BROKEN_ARCHIVE_DIR not in str(old_path) and TEMP_FOLDER_DIR not in str(old_path):
+                placed_content.setdefault(kept, old_path)
+            continue
+        old_path, new_path = paths
+        if kept in placed_content:
+            kept_path = placed_content[kept]
+            operations.append(FileOperation("delete" if delete else "exists", False, str(old_path), str(kept_path)))
+            continue
+        if str(new_path) in claimed:
+            action = "delete" if delete else "exists"
+        else:
+            claimed.add(str(new_path))
+            action = "move" if delete else "copy"
+            placed_content[kept] = new_path
+        partner = None
+        partner_entry = partners.get(entry)
+        partner_kept = duplicates.get(partner_entry, partner_entry)
+        if action in ["copy", "move"] and partner_entry is not None and partner_kept not in placed_content:
+            partner_paths = planned_paths(partner_entry, root_dir)
+            if partner_paths is not None and str(partner_paths[1]) not in claimed:
+                claimed.add(str(partner_paths[1]))
+                paired.add(partner_entry)
+                placed_content[partner_kept] = partner_paths[1]
+                partner = [str(partner_paths[0]), str(partner_paths[1])]
+        operations.append(FileOperation(action, is_rearchived(entry, old_path, new_path), str(old_path), str(new_path), partner))
+    return operations
+
+
+def file_operation_dirs(operation, root_dir):
+    dirs = []
+    for source, destination in operation_files(operation):
+        dirs.append(destination.parent)
+        if operation.action in ["move", "delete"]:
+            dirs.append(source.parent)
+    if operation.archive:
+        dirs += [Path(root_dir) / BROKEN_ARCHIVE_DIR, Path(root_dir) / TEMP_FOLDER_DIR / Path(operation.destination).stem]
+    return dirs
+
+
+def perform_file_operation(operation, root_dir, made_dirs=None, link_mode="copy"):
+    """Run one planned operation and return what happened to it and how many bytes it covered."""
+    delete = operation.action == "move"
+    size = 0
+    outcome = "copied"
+    for old_path, new_path in operation_files(operation):
+        # Half of a pair can already be in place, whole operations that are get skipped before this
+        if operation.partner and new_path.exists():
+            logger.debug(f"Already Exists: {old_path} vs {new_path}")
+            handle_delete_original(old_path, new_path, delete)
+            continue
         try:
+            size += old_path.stat().st_size
+            make_dirs([new_path.parent], made_dirs)
             # Process archives (.zip, .rar)
-            if entry.file_ext in [".zip", ".rar"] and not new_path.name == old_path.name:
-                process_archive(old_path, new_path, new_path_fallback, temp_dir, entry)
+            if operation.archive:
+                new_path_fallback = Path(root_dir) / BROKEN_ARCHIVE_DIR / new_path.name
+                temp_dir = Path(root_dir) / TEMP_FOLDER_DIR / new_path.stem
+                outcome = "archived" if process_archive(old_path, new_path, new_path_fallback, temp_dir) else "errored"
+            elif not delete:
+                placed = place_file(old_path, new_path, link_mode)
+                logger.debug(f"{placed}: {old_path} to {new_path}")
             else:
-                if not delete:
-                    shutil.copy2(old_path, new_path)
-                    print(f"\nCopied:\n {old_path} to\n {new_path}", flush=True)
-                else:
-                    print(f"\nMoved:\n {old_path} to\n {new_path}", flush=True)
-                    old_path.rename(new_path)
+                logger.debug(f"Moved: {old_path} to {new_path}")
+                old_path.rename(new_path)
         except Exception as e:
-            print(f"\nError: {e}\n")
-            return
+            logger.error(f"Error: {e}")
+            return "errored", 0
+
+        handle_delete_original(old_path, new_path, delete)
+    return outcome, size
+
+
+def trees_overlap(path, other_path):
+    path, other_path = Path(path).resolve(), Path(other_path).resolve()
+    return path == other_path or path in other_path.parents or other_path in path.parents
+
+
+def apply_file_operations(operations, source_dir, root_dir, jobs=1, link_mode="copy", journal=None):
+    """Run planned operations and return the directories they touched.
+
+    Plain copies and moves go to a thread pool and archives to a process pool. When the source
+    and destination trees overlap, a destination can be another operation's source, so
+    everything runs serially in order instead. With a journal, operations are recorded as they
+    start and finish, finished ones are skipped and the partial output of unfinished ones, which
+    includes ones that errored, is removed before they are redone.
+    """
+    root_dir = Path(root_dir)
+    touched_dirs = set()
+    made_dirs = set()
+    serial = jobs <= 1 or trees_overlap(source_dir, root_dir)
+    progress.start_stage("Placing files", len(operations))
+    # Archive workers are separate processes, their log records are handed to this process's handlers
+    log_queue = multiprocessing.Queue()
+    log_listener = QueueListener(log_queue, *logger.handlers, respect_handler_level=True)
+    log_listener.start()
+    archive_executor = ProcessPoolExecutor(max_workers=jobs, initializer=log_to_queue, initargs=(log_queue,))
+    try:
+        with ThreadPoolExecutor(max_workers=jobs) as copy_executor, archive_executor:
+            futures = []
+            for index, operation in enumerate(operations):
+                progress.check_cancelled()
+                files = operation_files(operation)
+                touched_dirs.update(file_operation_dirs(operation, root_dir))
+                if journal and index in journal.done:
+                    continue
+                if journal and index in journal.started:
+                    # A finished move leaves nothing at the source, anything else left behind is partial
+                    unfinished = [new_path for old_path, new_path in files if old_path.exists() or not new_path.exists()]
+                    if not unfinished:
+                        journal.record("done", index)
+                        continue
+                    for new_path in unfinished:
+                        new_path.unlink(missing_ok=True)
+                elif operation.action in ["exists", "delete"] or all(new_path.exists() for _, new_path in files):
+                    for old_path, new_path in files:
+                        logger.debug(f"Already Exists: {old_path} vs {new_path}")
+                        handle_delete_original(old_path, new_path, operation.action in ["move", "delete"])
+                    progress.add("skipped")
+                    if journal:
+                        journal.record("done", index)
+                    continue
+                if journal:
+                    journal.record("start", index)
+                if serial:
+                    outcome, size = perform_file_operation(operation, root_dir, made_dirs, link_mode)
+                    progress.add(outcome, size)
+                    # Failed operations stay started only, so resuming the plan tries them again
+                    if journal and outcome != "errored":
+                        journal.record("done", index)
+                    continue
+                if operation.archive:
+                    future = archive_executor.submit(perform_file_operation, operation, root_dir)
+                else:
+                    future = copy_executor.submit(perform_file_operation, operation, root_dir, made_dirs, link_mode)
+                future.add_done_callback(lambda future, index=index: finish_file_operation(future, index, journal))
+                futures.append(future)
+            for future in futures:
+                if progress.cancelled.is_set():
+                    # Operations that have not started are dropped, running ones finish first
+                    for pending in futures:
+                        pending.cancel()
+                    break
+                future.result()
+            progress.check_cancelled()
+    finally:
+        log_listener.stop()
+    progress.finish_stage()
+    return touched_dirs
 
-    handle_delete_original(old_path, new_path, delete)
+
+def finish_file_operation(future, index, journal=None):
+    # Runs in the parent process once a pooled operation is done
+    if future.cancelled():
+        return
+    outcome, size = future.result()
+    progress.add(outcome, size)
+    if journal and outcome != "errored":
+        journal.record("done", index)
+
+
+class PlanJournal:
+    """Append-only record of which operations of a plan were started and finished.
+
+    Operations are recorded by index, so the journal starts with a digest of its plan and a
+    journal left behind by a different plan written to the same path is started over.
+    """
+
+    def __init__(self, journal_path, plan_digest):
+        self.started = set()
+        self.done = set()
+        header = f"plan {plan_digest}"
+        matches = False
+        if os.path.exists(journal_path):
+            with open(journal_path, "r") as journal_file:
+                matches = journal_file.readline().strip() == header
+                for line in journal_file if matches else []:
+                    state, _, index = line.strip().partition(" ")
+                    if state == "start" and index.isdigit():
+                        self.started.add(int(index))
+                    elif state == "done" and index.isdigit():
+                        self.done.add(int(index))
+        self.journal_file = open(journal_path, "a" if matches else "w")
+        if not matches:
+            self.journal_file.write(f"{header}\n")
+            self.journal_file.flush()
+        self.lock = threading.Lock()
+
+    def record(self, state, index):
+        with self.lock:
+            self.journal_file.write(f"{state} {index}\n")
+            self.journal_file.flush()
+
+    def close(self):
+        self.journal_file.close()
+
+
+def write_plan(plan_path, operations, source_dir, root_dir):
+    # One JSON header line, then one [action, archive, source, destination, partner] line per operation
+    with open(plan_path, "w", encoding="utf-8") as plan_file:
+        plan_file.write(json.dumps({"source": str(source_dir), "destination": str(root_dir)}, ensure_ascii=False) + "\n")
+        for operation in operations:
+            plan_file.write(json.dumps(list(operation), ensure_ascii=False) + "\n")
+    logger.info(f"Wrote {len(operations)} file operations to {plan_path}")
+
+
+def read_plan_header(plan_path):
+    with open(plan_path, "r", encoding="utf-8") as plan_file:
+        return json.loads(plan_file.readline())
+
+
+def read_plan(plan_path):
+    with open(plan_path, "r", encoding="utf-8") as plan_file:
+        header = json.loads(plan_file.readline())
+        operations = [FileOperation(*json.loads(line)) for line in plan_file if line.strip()]
+    return header["source"], header["destination"], operations
+
+
+def apply_plan(plan_path, jobs=1, link_mode="copy", profiler=None):
+    profiler = profiler or StageProfiler()
+    source_dir, root_dir, operations = read_plan(plan_path)
+    with open(plan_path, "rb") as plan_file:
+        plan_digest = hashlib.sha256(plan_file.read()).hexdigest()
+    journal = PlanJournal(f"{plan_path}.journal", plan_digest)
+    if journal.done:
+        logger.info(f"Resuming plan, {len(journal.done)} of {len(operations)} file operations already done")
+    try:
+        with profiler.stage("place"):
+            touched_dirs = apply_file_operations(operations, source_dir, root_dir, jobs, link_mode, journal)
+    finally:
+        journal.close()
+    with profiler.stage("cleanup"):
+        remove_temp_directory(Path(root_dir))
+        remove_empty_dirs(root_dir, touched_dirs)
 
 
-def process_archive(old_path, new_path, new_path_fallback, temp_dir, entry):
+def process_archive(old_path, new_path, new_path_fallback, temp_dir, entry=None):
     """Process archive files by decompressing, renaming contents, and re-archiving."""
+    if Path(old_path).suffix.lower() == ".zip":
+        try:
+            rename_zip_members(old_path, new_path)
+            logger.debug(f"Copied and renamed contents: {old_path} to {new_path}")
+            return True
+        except Exception as e:
+            new_path.unlink(missing_ok=True)
+            logger.debug(f"Could not rename zip members in place ({e}), extracting instead: {old_path}")
     try:
+        temp_dir.mkdir(parents=True, exist_ok=True)
         with ArchiveFile(old_path) as archive:
             archive.extractall(destination=temp_dir)
             # Rename files inside the archive
@@ -621,25 +1767,126 @@ def process_archive(old_path, new_path, new_path_fallback, temp_dir, entry):
                 for file in temp_dir.iterdir():
                     if file.is_file():
                         new_archive.write(file, arcname=file.name)
-        print(f"\nCopied and renamed contents:\n {old_path} to\n {new_path}", flush=True)
+        logger.debug(f"Copied and renamed contents: {old_path} to {new_path}")
+        return True
     except Exception as e:
-        print(f"\nError: {e}. Bad archive file: {old_path}\n", flush=True)
-        print(f"Copying bad archive from {old_path} to {new_path_fallback}.", flush=True)
+        logger.error(f"Error: {e}. Bad archive file: {old_path}")
+        logger.debug(f"Copying bad archive from {old_path} to {new_path_fallback}.")
+        new_path_fallback.parent.mkdir(parents=True, exist_ok=True)
         shutil.copy2(old_path, new_path_fallback)
+        return False
     finally:
         # Ensure the temp_dir is deleted after processing
         shutil.rmtree(temp_dir, ignore_errors=True)
-        print(f"\nTemporary directory {temp_dir} deleted.", flush=True)
+        logger.debug(f"Temporary directory {temp_dir} deleted.")
+
+
+# Zip64 archives are left to the extract and re-archive path
+ZIP_SIZE_LIMIT = 0xFFFF0000
+
+
+def rename_zip_members(old_path, new_path):
+    """Write a zip whose members are renamed like process_archive does, copying the compressed data as is."""
+    if os.path.getsize(old_path) > ZIP_SIZE_LIMIT:
+        raise ValueError("zip64 archive")
+    with zipfile.ZipFile(old_path) as source:
+        # Like renaming extracted files, a later member replaces an earlier one with the same new name
+        members = {}
+        for info in source.infolist():
+            if not info.is_dir():
+                members[f"{new_path.stem}{PurePosixPath(info.filename).suffix}"] = info
+    if len(members) >= 0xFFFF or any(info.flag_bits & 0x1 for info in members.values()):
+        raise ValueError("encrypted or oversized archive")
+
+    central_directory = []
+    with open(old_path, "rb") as source_file, open(new_path, "wb") as target_file:
+        for name, info in members.items():
+            source_file.seek(info.header_offset)
+            local_header = struct.unpack(zipfile.structFileHeader, source_file.read(zipfile.sizeFileHeader))
+            if local_header[0] != zipfile.stringFileHeader:
+                raise zipfile.BadZipFile(f"bad local header for {info.filename}")
+            source_file.seek(local_header[10] + local_header[11], os.SEEK_CUR)
+
+            new_info = zipfile.ZipInfo(name, date_time=info.date_time)
+            new_info.compress_type = info.compress_type
+            new_info.CRC = info.CRC
+            new_info.compress_size = info.compress_size
+            new_info.file_size = info.file_size
+            new_info.external_attr = info.external_attr
+            new_info.create_system = info.create_system
+            # Sizes are written in the local header, so no data descriptor follows the data
+            new_info.flag_bits = info.flag_bits & ~0x8
+            new_info.header_offset = target_file.tell()
+            target_file.write(new_info.FileHeader())
+            remaining = info.compress_size
+            while remaining:
+                chunk = source_file.read(min(remaining, 1 << 20))
+                if not chunk:
+                    raise zipfile.BadZipFile(f"truncated data for {info.filename}")
+                target_file.write(chunk)
+                remaining -= len(chunk)
+            central_directory.append(new_info)
+
+        start_of_central_directory = target_file.tell()
+        for new_info in central_directory:
+            try:
+                file_name = new_info.filename.encode("ascii")
+                flag_bits = new_info.flag_bits
+            except UnicodeEncodeError:
+                file_name = new_info.filename.encode("utf-8")
+                flag_bits = new_info.flag_bits | 0x800
+            date_time = new_info.date_time
+            dos_time = date_time[3] << 11 | date_time[4] << 5 | date_time[5] // 2
+            dos_date = (date_time[0] - 1980) << 9 | date_time[1] << 5 | date_time[2]
+            target_file.write(
+                struct.pack(
+                    zipfile.structCentralDir,
+                    zipfile.stringCentralDir,
+                    new_info.create_version,
+                    new_info.create_system,
+                    new_info.extract_version,
+                    0,
+                    flag_bits,
+                    new_info.compress_type,
+                    dos_time,
+                    dos_date,
+                    new_info.CRC,
+                    new_info.compress_size,
+                    new_info.file_size,
+                    len(file_name),
+                    0,
+                    0,
+                    0,
+                    0,
+                    new_info.external_attr,
+                    new_info.header_offset,
+                )
+            )
+            target_file.write(file_name)
+        central_directory_size = target_file.tell() - start_of_central_directory
+        target_file.write(
+            struct.pack(
+                zipfile.structEndArchive,
+                zipfile.stringEndArchive,
+                0,
+                0,
+                len(central_directory),
+                len(central_directory),
+                central_directory_size,
+                start_of_central_directory,
+                0,
+            )
+        )
 
 
 def remove_temp_directory(root_dir: Path):
     # Convert dir_path to a Path object if it's not already one
-    temp_dir = root_dir / "#Temp Folder Delete Me"
+    temp_dir = root_dir / TEMP_FOLDER_DIR
     if temp_dir.exists() and temp_dir.is_dir():
         shutil.rmtree(temp_dir)
-        print(f"Removed directory: {temp_dir}")
+        logger.info(f"Removed directory: {temp_dir}")
     else:
-        print(f"Directory does not exist: {temp_dir}")
+        logger.info(f"Directory does not exist: {temp_dir}")
 
 
 def handle_delete_original(old_path, new_path, delete=False):
@@ -647,54 +1894,510 @@ def handle_delete_original(old_path, new_path, delete=False):
     if not delete:
         return
     if str(old_path).lower() == str(new_path).lower():
-        print(f"Not deleting same path: {new_path} to {old_path}", flush=True)
+        logger.debug(f"Not deleting same path: {new_path} to {old_path}")
         return
     try:
         if os.path.exists(old_path):
             os.remove(old_path)
-            print(f"Deleted original file: {old_path}", flush=True)
+            logger.debug(f"Deleted original file: {old_path}")
     except Exception as e:
-        print(f"\nError deleting file {old_path}: {e}\n", flush=True)
+        logger.error(f"Error deleting file {old_path}: {e}")
 
 
-def remove_empty_dirs(path):
-    # Traverse the directory tree from the bottom up
-    print("Removing empty directories", flush=True)
-    for dirpath, dirnames, filenames in os.walk(path, topdown=False):
-        for dirname in dirnames:
-            dir_to_check = os.path.join(dirpath, dirname)
-            # Check if the directory is empty
-            if not os.listdir(dir_to_check):
-                # Remove the empty directory
-                os.rmdir(dir_to_check)
-                print(f"Removed empty directory: {dir_to_check}", flush=True)
+def remove_empty_dirs(path, touched_dirs=None):
+    # Only the touched directories and their parents are checked when they are known,
+    # otherwise the directory tree is traversed from the bottom up
+    logger.info("Removing empty directories")
+    if touched_dirs is None:
+        dirs_to_check = []
+        for dirpath, dirnames, filenames in os.walk(path, topdown=False):
+            dirs_to_check.extend(os.path.join(dirpath, dirname) for dirname in dirnames)
+    else:
+        root = Path(path)
+        parents = set()
+        for dir_path in touched_dirs:
+            while root in dir_path.parents:
+                parents.add(dir_path)
+                dir_path = dir_path.parent
+        dirs_to_check = sorted(parents, key=lambda dir_path: len(dir_path.parts), reverse=True)
+    for dir_to_check in dirs_to_check:
+        # Check if the directory is empty
+        if os.path.isdir(dir_to_check) and not os.listdir(dir_to_check):
+            # Remove the empty directory
+            os.rmdir(dir_to_check)
+            logger.debug(f"Removed empty directory: {dir_to_check}")
+
+
+class LiveSongBook:
+    """A cleaned song book that new files are fitted into as they show up, without cleaning the whole book again.
+
+    Artists already in the book are never renamed, so files that were already placed stay where they are.
+    """
+
+    def __init__(self, song_book, broken_entries, flattened, root_dir, flip=True, merge=True, track_sources=True, operations=()):
+        self.song_book = song_book
+        self.flattened = flattened
+        self.flip = flip
+        self.merge = merge
+        self.artist_titles = {artist: {entry.title for entry in entries} for artist, entries in song_book.items()}
+        self.title_index = defaultdict(set)
+        for artist, titles in self.artist_titles.items():
+            for title in titles:
+                self.title_index[title].add(artist)
+        all_entries = [entry for entries in song_book.values() for entry in entries] + list(broken_entries)
+        # Files already in their place, so seeing them again when the trees overlap is not news
+        self.placed = {str(destination_path(entry, root_dir)) for entry in all_entries}
+        # Source path -> entry, so a changed file replaces its old entry. Moved files leave no source behind.
+        self.track_sources = track_sources
+        self.entries_by_path = {str(entry.old_path()): entry for entry in all_entries} if track_sources else {}
+        # Source path -> the library file that was copied from it, so a changed file can replace it
+        self.placed_files = {}
+        self.record_placed(operations)
+
+    def record_placed(self, operations):
+        if not self.track_sources:
+            return
+        for operation in operations:
+            if operation.action in ["copy", "move"]:
+                for source, destination in operation_files(operation):
+                    self.placed_files[str(source)] = str(destination)
 
+    def is_new(self, path, since):
+        # Files parsed by the first full run can also show up as changes made while it ran
+        try:
+            return path not in self.entries_by_path or os.stat(path).st_mtime >= since
+        except OSError:
+            return False
+
+    def forget(self, path):
+        """Drop the entry parsed from path and return the library file placed from it, if there is one."""
+        entry = self.entries_by_path.pop(path, None)
+        placed_file = self.placed_files.pop(path, None)
+        if entry is None or not entry.artist:
+            return placed_file
+        entries = self.song_book[entry.artist]
+        entries.remove(entry)
+        titles = {other.title for other in entries}
+        for title in self.artist_titles[entry.artist] - titles:
+            self.title_index[title].discard(entry.artist)
+        if entries:
+            self.artist_titles[entry.artist] = titles
+            self.flattened[entry.artist] = remove_similar_songs(sorted(titles))
+        else:
+            del self.song_book[entry.artist], self.artist_titles[entry.artist], self.flattened[entry.artist]
+        return placed_file
 
-def run_fix_songs(args):
-    folder_path = args.folder_path
-    new_path = args.new_path
-    song_book, broken_song_book = read_song_book_from_dir(folder_path)
-    for artist in sorted(song_book):
-        name_cdg_to_mp3(song_book[artist])
-    song_book = clean_song_book(song_book, args.flip, args.merge)
+    def is_flipped(self, artist, entries):
+        # Same test as fix_song_artist_flipped, against the artists already in the book
+        if artist in self.song_book:
+            return False
+        for entry in entries:
+            if entry.title == entry.artist:
+                return False
+            found = title_as_artist(entry.title, self.song_book)
+            if found is None or len(entries) > len(self.song_book[found]):
+                return False
+        return True
+
+    def resolve_artist(self, artist, entries):
+        if artist in self.song_book:
+            return artist
+        if f"{artist}, the" in self.song_book:
+            return f"{artist}, the"
+        if artist.endswith(", the") and artist.removesuffix(", the") in self.song_book:
+            return artist.removesuffix(", the")
+        if self.merge:
+            # Same test as merge_similar_typo_artists, against the artists sharing a title with these entries
+            clean_name = fix_the(artist, Mode.REMOVE)
+            titles = {entry.title for entry in entries}
+            shared_titles = Counter(other for title in titles for other in self.title_index.get(title, ()))
+            matches = [
+                other
+                for other, common_songs in shared_titles.items()
+                if is_typo_artist(clean_name, fix_the(other, Mode.REMOVE), common_songs, min(len(titles), len(self.artist_titles[other])))
+            ]
+            if matches:
+                return max(sorted(matches), key=lambda other: len(self.song_book[other]))
+        return artist
+
+    def add(self, new_song_book, broken_entries=()):
+        """Fit newly parsed entries into the book and return them grouped by the artist they ended up under."""
+        added = defaultdict(list)
+        for artist in sorted(new_song_book):
+            entries = new_song_book[artist]
+            if self.flip and self.is_flipped(artist, entries):
+                for entry in entries:
+                    flip_entry(entry)
+                    added[self.resolve_artist(entry.artist, [entry])].append(entry)
+            else:
+                added[self.resolve_artist(artist, entries)].extend(entries)
+        for artist, entries in added.items():
+            for entry in entries:
+                entry.artist = artist
+            self.song_book.setdefault(artist, []).extend(entries)
+            self.artist_titles.setdefault(artist, set()).update(entry.title for entry in entries)
+            for entry in entries:
+                self.title_index[entry.title].add(artist)
+            # The same list flatten_titles would hand over for this artist
+            self.flattened[artist] = remove_similar_songs(sorted({entry.title for entry in self.song_book[artist]}))
+        if self.track_sources:
+            for entry in [entry for entries in added.values() for entry in entries] + list(broken_entries):
+                self.entries_by_path[str(entry.old_path())] = entry
+        return added
+
+
+# inotify event bits, from <sys/inotify.h>
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class InotifyWatcher:
+    """Reports music files created, written or moved anywhere under a folder, through Linux inotify."""
+
+    def __init__(self, root_dir):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"inotify_init1: {os.strerror(error)}")
+        self.root_dir = str(root_dir)
+        self.watches = {}
+        try:
+            self.add_tree(self.root_dir)
+        except OSError:
+            os.close(self.fd)
+            raise
+
+    def add_watch(self, dir_path):
+        watch = self.libc.inotify_add_watch(self.fd, os.fsencode(dir_path), INOTIFY_MASK)
+        if watch < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, f"Could not watch {dir_path}: {os.strerror(error)}")
+        self.watches[watch] = dir_path
+
+    def add_tree(self, dir_path):
+        # Each folder is watched before it is listed, so files landing in between are not missed
+        self.add_watch(dir_path)
+        found = []
+        for dirpath, dirnames, filenames in os.walk(dir_path):
+            dirnames[:] = [name for name in sorted(dirnames) if name not in SKIPPED_DIRS and not name.startswith(".")]
+            for name in dirnames:
+                self.add_watch(os.path.join(dirpath, name))
+            found.extend(os.path.join(dirpath, name) for name in sorted(filenames) if is_music(name) and not name.startswith("."))
+        return found
+
+    def changes(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 1 << 16)
+        paths = []
+        offset = 0
+        while offset < len(data):
+            watch, mask, _, length = INOTIFY_EVENT.unpack_from(data, offset)
+            offset += INOTIFY_EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped, so every file gets looked at again
+                logger.warning("Too many changes at once, rescanning the whole folder")
+                paths.extend(find_music_files(self.root_dir))
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(watch, None)
+                continue
+            dir_path = self.watches.get(watch)
+            if dir_path is None or not name or name.startswith("."):
+                continue
+            path = os.path.join(dir_path, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and name not in SKIPPED_DIRS:
+                    try:
+                        paths.extend(self.add_tree(path))
+                    except OSError as e:
+                        logger.error(f"Error: {e}")
+            elif is_music(name):
+                paths.append(path)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Finds new and changed music files by rescanning a folder, where inotify is not available."""
+
+    def __init__(self, root_dir, interval=5.0):
+        self.root_dir = str(root_dir)
+        self.interval = interval
+        self.last_scan = time.monotonic()
+        self.seen = self.scan()
+
+    def scan(self):
+        seen = {}
+        for dir_entry in find_music_entries(self.root_dir):
+            try:
+                stat = dir_entry.stat()
+            except OSError:
+                continue
+            seen[dir_entry.path] = (stat.st_size, stat.st_mtime_ns)
+        return seen
+
+    def changes(self, timeout):
+        time.sleep(timeout)
+        if time.monotonic() - self.last_scan < self.interval:
+            return []
+        self.last_scan = time.monotonic()
+        seen = self.scan()
+        changed = [path for path, stat in seen.items() if self.seen.get(path) != stat]
+        self.seen = seen
+        return changed
+
+    def close(self):
+        pass
+
+
+def make_watcher(root_dir, poll_interval=5.0):
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(root_dir)
+        except (OSError, AttributeError) as e:
+            logger.warning(f"Could not use inotify ({e}), rescanning {root_dir} every {poll_interval}s instead")
+    return PollingWatcher(root_dir, poll_interval)
+
+
+# How often the watch loop wakes up to hand settled files over
+WATCH_TICK_SECONDS = 0.5
+
+
+def watch_songs(args, watcher, live, since):
+    """Process files dropped into the source folder until interrupted, once they have stopped changing."""
+    logger.info(f"Watching {args.folder_path} for new songs, press Ctrl+C to stop")
+    flush_logging()
+    pending = {}
+    try:
+        while True:
+            progress.check_cancelled()
+            for path in watcher.changes(WATCH_TICK_SECONDS):
+                if path not in live.placed:
+                    pending[path] = time.monotonic()
+            now = time.monotonic()
+            settled = sorted(path for path, changed in pending.items() if now - changed >= args.watch_delay)
+            if settled:
+                for path in settled:
+                    del pending[path]
+                try:
+                    add_new_songs(settled, args, live, since)
+                except Cancelled:
+                    raise
+                except Exception as e:
+                    # Files come and go in an intake folder, one bad batch should not stop watching
+                    logger.error(f"Error adding {', '.join(settled)}: {e}")
+                flush_logging()
+    except (KeyboardInterrupt, Cancelled):
+        logger.info("Stopped watching")
+    finally:
+        watcher.close()
+
+
+def add_new_songs(paths, args, live, since):
+    paths = [path for path in paths if os.path.isfile(path) and live.is_new(path, since)]
+    if not paths:
+        return
+    new_song_book = defaultdict(list)
+    broken_song_book = defaultdict(list)
+    progress.reset()
+    progress.start_stage("Parsing")
+    stale_files = []
+    for entry in parse_song_paths(paths, args.jobs):
+        stale_files.append(live.forget(str(entry.old_path())))
+        add_to_song_book(entry, new_song_book, broken_song_book)
+    progress.finish_stage()
+    cdg_pairs = pair_cdg_files([entry for entries in new_song_book.values() for entry in entries] + broken_song_book.get("", []))
+    added = live.add(new_song_book, broken_song_book.get("", []))
     if not args.dryrun:
-        for artist in sorted(song_book):
-            for entry in sorted(song_book[artist]):
-                rename_and_rearchive(entry, Path(new_path), args.delete)
+        # A changed file replaces the copy placed from it before, which may now belong somewhere else
+        for stale_file in filter(None, stale_files):
+            logger.debug(f"Replacing: {stale_file}")
+            Path(stale_file).unlink(missing_ok=True)
+            live.placed.discard(stale_file)
+        entries = [entry for artist in sorted(added) for entry in sorted(added[artist])]
+        entries.extend(broken_song_book.get("", []))
+        operations = plan_file_operations(entries, Path(args.new_path), args.delete, cdg_pairs=cdg_pairs)
+        # Recorded before anything is placed, so the placed files do not come back as new ones
+        live.placed.update(str(destination) for operation in operations for _, destination in operation_files(operation))
+        live.record_placed(operations)
+        touched_dirs = apply_file_operations(operations, args.folder_path, Path(args.new_path), args.jobs, args.link_mode)
+        remove_temp_directory(Path(args.new_path))
+        remove_empty_dirs(args.new_path, touched_dirs)
+    write_catalog_files(live.flattened, args.new_path, args.jobs)
+    logger.info(f"Added {len(paths)} files, the catalog has {len(live.flattened)} artists")
+
+
+def run_fix_songs(args, console_handler=None):
+    new_path = read_plan_header(args.apply)["destination"] if args.apply else args.new_path
+    setup_logging(args.log_file or Path(new_path) / SONG_BOOK_DIR / "fixsongs.log", args.verbose, console_handler)
+    progress.reset()
+    profiler = StageProfiler(args.profile or args.profile_stage is not None, args.profile_stage)
+    watcher = None
+    try:
+        if args.apply:
+            check_link_mode(read_plan_header(args.apply)["source"], new_path, args.link_mode)
+            apply_plan(args.apply, args.jobs, args.link_mode, profiler)
+        elif args.catalog_only:
+            rebuild_catalogs(new_path, args.jobs, profiler)
+        else:
+            if not (args.plan or args.dryrun or args.delete):
+                check_link_mode(args.folder_path, new_path, args.link_mode)
+            # Started before the first run, so files dropped while it runs are picked up afterwards
+            watcher = make_watcher(args.folder_path, args.poll_interval) if args.watch else None
+            since = time.time()
+            song_book, broken_song_book, flattened, operations = fix_songs(args, profiler)
+        profiler.write_report(Path(new_path) / SONG_BOOK_DIR, args)
+        if watcher:
+            live = LiveSongBook(
+                song_book,
+                broken_song_book.get("", []),
+                flattened,
+                Path(new_path),
+                args.flip,
+                args.merge,
+                track_sources=not args.delete,
+                operations=operations,
+            )
+            watch_songs(args, watcher, live, since)
+    finally:
+        flush_logging()
 
-        if "" in broken_song_book:
-            for entry in broken_song_book[""]:
-                rename_and_rearchive(entry, Path(new_path), args.delete)
+
+def fix_songs(args, profiler=None):
+    profiler = profiler or StageProfiler()
+    folder_path = args.folder_path
+    new_path = args.new_path
+    if args.plan:
+        # A plan can be applied from any directory, so every path written into it is absolute
+        folder_path, new_path = os.path.abspath(folder_path), os.path.abspath(new_path)
+    set_short_hash_mode(args.hash_mode)
+    with profiler.stage("parse"):
+        index = SongIndex(args.index) if args.index else None
+        song_book, broken_song_book = read_song_book_from_dir(folder_path, args.jobs, index=index)
+        if index:
+            index.close()
+    with profiler.stage("pair_cdg"):
+        cdg_pairs = pair_cdg_files([entry for entries in song_book.values() for entry in entries] + broken_song_book.get("", []))
+    with profiler.stage("clean"):
+        song_book = clean_song_book(song_book, args.flip, args.merge)
+    entries = [entry for artist in sorted(song_book) for entry in sorted(song_book[artist])]
+    entries.extend(broken_song_book.get("", []))
+    duplicates = None
+    if args.dedup != "off":
+        with profiler.stage("dedup"):
+            duplicates = find_duplicate_entries(entries, args.jobs)
+            log_duplicates(duplicates)
+    touched_dirs = set()
+    operations = []
+    with profiler.stage("place"):
+        if args.plan or not args.dryrun:
+            operations = plan_file_operations(
+                entries, Path(new_path), args.delete, duplicates if args.dedup == "skip" else None, cdg_pairs
+            )
+            if args.plan:
+                write_plan(args.plan, operations, folder_path, new_path)
+            else:
+                touched_dirs = apply_file_operations(operations, folder_path, Path(new_path), args.jobs, args.link_mode)
 
     # Remove directories
-    remove_temp_directory(Path(new_path))
-    remove_empty_dirs(new_path)
+    with profiler.stage("cleanup"):
+        remove_temp_directory(Path(new_path))
+        remove_empty_dirs(new_path, touched_dirs)
 
     # make latex and json catalogs
-    flattened_dict = {artist: {entry.title for entry in song_book[artist]} for artist in song_book}
-    for artist in flattened_dict:
-        flattened_dict[artist] = remove_similar_songs(flattened_dict[artist])
-    songbook_path = Path(new_path) / "#Song Book"
+    with profiler.stage("catalog"):
+        flattened = write_catalogs(song_book, new_path, args.jobs)
+    return song_book, broken_song_book, flattened, operations
+
+
+# The Artist/DISCID-NN - Artist - Title path destination_path gives a placed song, relative to its
+# letter folder. Slashes in an artist end up as extra folders, so the artist can span several.
+PLACED_SONG_PATTERN = re.compile(r"^(?P<artist>.+)/(?P<discid>[^/-]+)-(?P<trackno>\d+) - (?P=artist) - (?P<title>.+)$")
+
+
+def find_relative_files(path, prefix=""):
+    try:
+        with os.scandir(path) as it:
+            dir_entries = list(it)
+    except OSError:
+        return
+    for dir_entry in dir_entries:
+        if dir_entry.name.startswith("."):
+            continue
+        relative_path = f"{prefix}{dir_entry.name}"
+        if dir_entry.is_dir():
+            yield from find_relative_files(dir_entry.path, f"{relative_path}/")
+        else:
+            yield relative_path
+
+
+def find_placed_songs(root_dir):
+    """Yield (artist, title) for each song in a library this tool has already fixed, read from its path alone.
+
+    Placed names are title cased versions of the normalized names, so lower casing them gives the
+    catalog the same artists and titles a full run would.
+    """
+    try:
+        with os.scandir(root_dir) as it:
+            letter_dirs = sorted(dir_entry.path for dir_entry in it if dir_entry.is_dir() and not dir_entry.name.startswith((".", "#")))
+    except OSError:
+        return
+    for letter_dir in letter_dirs:
+        for relative_path in find_relative_files(letter_dir):
+            stem, file_ext = os.path.splitext(relative_path)
+            if file_ext.lower() not in valid_extensions:
+                continue
+            match = PLACED_SONG_PATTERN.match(stem)
+            if match is None:
+                logger.debug(f"not a placed song: {relative_path}")
+                progress.add("broken")
+                continue
+            progress.add("parsed")
+            yield match["artist"].lower(), match["title"].lower()
+
+
+def read_placed_titles(root_dir):
+    titles = defaultdict(set)
+    progress.start_stage("Reading placed songs")
+    for artist, title in find_placed_songs(root_dir):
+        titles[artist].add(title)
+    progress.finish_stage()
+    return titles
+
+
+def rebuild_catalogs(new_path, jobs=1, profiler=None):
+    """Write the song book straight from an already fixed library, without parsing or placing anything."""
+    profiler = profiler or StageProfiler()
+    with profiler.stage("parse"):
+        titles = read_placed_titles(new_path)
+    with profiler.stage("catalog"):
+        flattened = flatten_titles(titles, jobs)
+        write_catalog_files(flattened, new_path, jobs)
+    logger.info(f"Rebuilt the song book for {len(flattened)} artists")
+
+
+def write_catalogs(song_book, new_path, jobs=1):
+    flattened_dict = flatten_song_book(song_book, jobs)
+    write_catalog_files(flattened_dict, new_path, jobs)
+    return flattened_dict
+
+
+def write_catalog_files(flattened_dict, new_path, jobs=1):
+    songbook_path = Path(new_path) / SONG_BOOK_DIR
     songbook_path.mkdir(parents=True, exist_ok=True)
     website_path = songbook_path / "website"
     website_path.mkdir(parents=True, exist_ok=True)
@@ -709,16 +2412,114 @@ def run_fix_songs(args):
 
     json_output_path = website_path / "songs.json"
     sorted_data = {
-        titlecase(artist): sorted([titlecase(title) for title in titles])
+        cached_titlecase(artist): sorted([cached_titlecase(title) for title in titles])
         for artist, titles in sorted(flattened_dict.items())  # Sort artists
     }
     with open(json_output_path, "w") as json_file:
         json.dump(sorted_data, json_file, separators=(",", ":"))
+    write_search_index(sorted_data, website_path / "search-index.json")
+    write_catalog_shards(sorted_data, website_path / "catalog")
+    precompress_website(website_path, jobs)
     latex_output_path = songbook_path / "songbook.tex"
     write_latex_songbook_to_file(flattened_dict, latex_output_path)
 
 
-def main():
+THE_PREFIX_PATTERN = re.compile(r"^The\s(.+)", re.IGNORECASE)
+ARRAY_INDEX_PATTERN = re.compile(r"^(0|[1-9][0-9]*)$")
+
+
+def website_artist_name(artist):
+    # Same as normalizeArtist in website/app.js
+    match = THE_PREFIX_PATTERN.match(artist)
+    return f"{match.group(1)}, The" if match else artist
+
+
+def javascript_key_order(catalog):
+    # Browsers list integer-like object keys first, in numeric order, then the rest as written
+    integer_keys = sorted((key for key in catalog if ARRAY_INDEX_PATTERN.match(key) and int(key) < 2**32 - 1), key=int)
+    integer_set = set(integer_keys)
+    return integer_keys + [key for key in catalog if key not in integer_set]
+
+
+def write_search_index(catalog, output_path):
+    """Write the songs as [artist, titles] pairs, with the artist names the website shows.
+
+    Fuse builds its index from these in the browser, which for the one combined key costs little,
+    so only the songs themselves are downloaded.
+    """
+    # Same order app.js flattens songs.json in, so results and ties come out the same
+    songs = [[website_artist_name(artist), catalog[artist]] for artist in javascript_key_order(catalog)]
+    with open(output_path, "w") as index_file:
+        json.dump({"songs": songs}, index_file, separators=(",", ":"))
+
+
+# The letters of the browse dropdown in website/app.js
+BROWSE_LETTERS = "+0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+PRECOMPRESSED_SUFFIXES = {".json", ".js", ".css", ".html"}
+
+
+def write_catalog_shards(catalog, catalog_path):
+    """Split the catalog into one file per browse letter, plus a manifest.json with their names and counts."""
+    catalog_path.mkdir(parents=True, exist_ok=True)
+    shards = defaultdict(dict)
+    for artist, titles in catalog.items():
+        # Same test as the browse view: first character of the displayed name, upper-cased
+        letter = website_artist_name(artist)[0].upper()
+        if letter in BROWSE_LETTERS:
+            shards[letter][artist] = titles
+    manifest = {"artists": len(catalog), "songs": sum(len(titles) for titles in catalog.values()), "letters": {}}
+    for letter in BROWSE_LETTERS:
+        if letter not in shards:
+            continue
+        file_name = f"letter-{'plus' if letter == '+' else letter}.json"
+        with open(catalog_path / file_name, "w") as shard_file:
+            json.dump(shards[letter], shard_file, separators=(",", ":"))
+        manifest["letters"][letter] = {
+            "file": file_name,
+            "artists": len(shards[letter]),
+            "songs": sum(len(titles) for titles in shards[letter].values()),
+        }
+    with open(catalog_path / "manifest.json", "w") as manifest_file:
+        json.dump(manifest, manifest_file, separators=(",", ":"))
+    # Drop shards, and their compressed copies, of letters that no longer have any artists
+    written = {"manifest.json"} | {shard["file"] for shard in manifest["letters"].values()}
+    for path in catalog_path.iterdir():
+        if path.name.removesuffix(".gz").removesuffix(".br") not in written:
+            path.unlink()
+
+
+def precompress_file(path):
+    data = path.read_bytes()
+    gz_path = Path(f"{path}.gz")
+    # The whole site gets rewritten on every run, but only files whose content changed need compressing again
+    if gz_path.exists() and (brotli is None or Path(f"{path}.br").exists()):
+        if gzip.decompress(gz_path.read_bytes()) == data:
+            return
+    # mtime=0 keeps the .gz the same from run to run when the catalog has not changed
+    gz_path.write_bytes(gzip.compress(data, compresslevel=9, mtime=0))
+    if brotli is not None:
+        Path(f"{path}.br").write_bytes(brotli.compress(data))
+    else:
+        # Never leave a .br from an earlier run that no longer matches
+        Path(f"{path}.br").unlink(missing_ok=True)
+
+
+def precompress_website(website_path, jobs=1):
+    """Write .gz copies, and .br copies when brotli is installed, of the site's text files for servers that serve them as-is."""
+    paths = [path for path in website_path.rglob("*") if path.suffix in PRECOMPRESSED_SUFFIXES]
+    # zlib and brotli let go of the GIL while compressing
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        list(executor.map(precompress_file, paths))
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def build_parser():
     # Set up argument parser
     parser = argparse.ArgumentParser(description="Fix songs in the Karaoke song library.")
     parser.add_argument(
@@ -757,9 +2558,109 @@ def main():
         default=False,
         help="Don't make any file changes",
     )
+    parser.add_argument(
+        "--plan",
+        default=None,
+        help="Write the planned file operations to this file instead of changing any files",
+    )
+    parser.add_argument(
+        "--apply",
+        default=None,
+        help="Apply a plan written with --plan, resuming from its .journal file if it was interrupted",
+    )
+    parser.add_argument(
+        "--link-mode",
+        choices=LINK_MODES,
+        default="copy",
+        help="How files that are not rearchived get placed when not deleting: copy them, hardlink them, reflink them, "
+        "or auto to pick the cheapest that works (hardlink or reflink on the same device, then copy_file_range, then copy)",
+    )
+    parser.add_argument(
+        "--log-file",
+        default=None,
+        help="File that gets per-file detail, defaults to fixsongs.log in the destination's #Song Book folder",
+    )
+    parser.add_argument(
+        "--verbose",
+        action="store_true",
+        default=False,
+        help="Also show per-file detail on the console",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        default=False,
+        help="Record time, CPU, I/O and peak memory per stage into a profile-*.json report in #Song Book",
+    )
+    parser.add_argument(
+        "--profile-stage",
+        choices=PROFILE_STAGES,
+        default=None,
+        help="Also run this stage under cProfile and save its stats next to the report, implies --profile",
+    )
+    parser.add_argument(
+        "--jobs",
+        type=positive_int,
+        default=1,
+        help="Number of workers used to parse the song library and to copy and rearchive files",
+    )
+    parser.add_argument(
+        "--hash-mode",
+        choices=["full", "sampled"],
+        default="full",
+        help="How disc ids are made up for files without one: hash the whole file, or only its size and a few sampled blocks",
+    )
+    parser.add_argument(
+        "--index",
+        default=None,
+        help="SQLite file that remembers parsed songs between runs, so only new or changed files are parsed",
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=["off", "report", "skip"],
+        default="off",
+        help="Look for files with the same content, including zips holding the same songs: only report them in the log, "
+        "or also skip placing all but the first (deleting the others with --delete)",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        default=False,
+        help="After the first run, keep watching the source folder and add new or changed files as they show up",
+    )
+    parser.add_argument(
+        "--watch-delay",
+        type=float,
+        default=2.0,
+        help="Seconds a new file has to stay unchanged before --watch processes it",
+    )
+    parser.add_argument(
+        "--poll-interval",
+        type=float,
+        default=5.0,
+        help="Seconds between rescans of the source folder when --watch cannot use inotify",
+    )
+    parser.add_argument(
+        "--catalog-only",
+        action="store_true",
+        default=False,
+        help="Only rebuild the song book and website catalog from the songs already placed in new_path",
+    )
+    return parser
+
+
+def main():
+    parser = build_parser()
     args = parser.parse_args()
+    if args.watch and (args.plan or args.apply):
+        parser.error("--watch cannot be used with --plan or --apply")
+    if args.catalog_only and (args.plan or args.apply or args.watch):
+        parser.error("--catalog-only cannot be used with --plan, --apply or --watch")
     # Run the main song-fixing logic
-    run_fix_songs(args)
+    try:
+        run_fix_songs(args)
+    except LinkModeError as e:
+        parser.exit(2, f"{parser.prog}: error: {e}\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,151 @@
+import os
+import random
+import argparse
+import zipfile
+from pathlib import Path
+
+FIRST_NAMES = ["Frank", "Alicia", "Joss", "Eddie", "Aretha", "Johnny", "Dolly", "Elton", "Patsy", "Stevie", "Whitney", "Otis"]
+LAST_NAMES = ["Sinatra", "Keys", "Stone", "Fisher", "Franklin", "Cash", "Parton", "John", "Cline", "Wonder", "Houston", "Redding"]
+BAND_WORDS = ["Blind", "Eye", "Third", "Creed", "System", "Down", "Maniacs", "Stones", "Rolling", "Queens", "Stone", "Age",
+              "Black", "Keys", "Arctic", "Monkeys", "Killers", "Foo", "Fighters", "Green", "Day", "Pearl", "Jam", "Beatles"]
+TITLE_WORDS = ["My", "Way", "Karma", "Love", "Night", "Heart", "Baby", "Don't", "Stop", "Believin'", "Rock", "Roll", "Semi-Charmed",
+               "Life", "Prison", "Song", "Super", "Duper", "Oh!", "Pa-Pa", "It's", "Your", "One", "Last", "Breath", "Hokey", "Pokey",
+               "Dancing", "Queen", "Sweet", "Home", "Blue", "Moon", "Forever", "Tonight", "Rain", "Fire", "&", "Gold"]
+DISC_PREFIXES = ["SC", "CB", "PH", "SF", "CBE", "ASK", "SPC", "DK", "THM", "MM"]
+FLAGS = ["(wvocals)", "(Duet)", "(Christmas)", "[SC]"]
+
+# One shape per template documented in fixsongs.py, some shapes only match the loose templates
+SHAPES = [
+    "{did}-{tno} -{num} - {title}",
+    "{did}-{tno} - {num} - {artist} - {title}",
+    "{did}-{tno}-{num} - {artist} - {title}",
+    "{did}-{tno}-{num}-{num} - {artist} - {title}",
+    "{did}-{tno} - {artist} - {title}",
+    "{artist} - {title} - {did}-{tno}",
+    "{did}-{tno}",
+    "{num}-{title}",
+    "{artist} - {title}",
+    "{did}-{tno} - {num} - {artist} - {dashed_title}",
+    "{did}-{tno} - {artist} - {dashed_title}",
+    "{did}-{tno}-{num} - {artist} - {dashed_title}",
+    "{num} - {title} - {artist}",
+    "{artist} - {title} - G{code}",
+    "{did} - {num} - {artist}  - {title}",
+    "{did} - {num} - {title}",
+    "{prefix}-{code}-{num}0-{code} - {artist} - {title}",
+    "{did} - {num} - Duet ({artist} - {last}) - {title}",
+    "{prefix}-{code}A-{tno} - {artist} - {title}",
+]
+
+
+def make_artists(rng, count):
+    artists = set()
+    while len(artists) < count:
+        # Past the first few hundred the word lists run out, so number the rest
+        number = f" {rng.randint(2, 9999)}" if len(artists) > 300 else ""
+        if rng.random() < 0.5:
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            artists.add(rng.choice([f"{first}{number} {last}", f"{last}, {first}{number}"]))
+        else:
+            name = " ".join(rng.sample(BAND_WORDS, rng.randint(1, 3))) + number
+            artists.add(rng.choice([name, f"The {name}", f"{name}, The"]))
+    return sorted(artists)
+
+
+def make_typo(rng, name):
+    # Swap two neighbouring letters, the kind of mistake merge_similar_typo_artists fixes
+    index = rng.randrange(max(len(name) - 1, 1))
+    return name[:index] + name[index + 1 : index + 2] + name[index : index + 1] + name[index + 2 :]
+
+
+def make_title(rng):
+    return " ".join(rng.sample(TITLE_WORDS, rng.randint(1, 4)))
+
+
+def make_file_name(rng, artist, title):
+    did = f"{rng.choice(DISC_PREFIXES)}{rng.randint(1, 9999)}"
+    shape = rng.choice(SHAPES)
+    return shape.format(
+        did=did if rng.random() < 0.8 else did.lower(),
+        tno=f"{rng.randint(1, 20):02d}",
+        num=f"{rng.randint(1, 20):02d}",
+        artist=artist,
+        last=rng.choice(LAST_NAMES),
+        title=title,
+        dashed_title=title.replace(" ", "-", 1),
+        prefix=rng.choice(DISC_PREFIXES),
+        code=rng.randint(100, 99999),
+    )
+
+
+def write_zip(path, stem, rng):
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr(zipfile.ZipInfo(f"{stem}.mp3", (2020, 1, 1, 0, 0, 0)), rng.randbytes(rng.randint(256, 4096)))
+        archive.writestr(zipfile.ZipInfo(f"{stem}.cdg", (2020, 1, 1, 0, 0, 0)), bytes(rng.randint(256, 4096)))
+
+
+def make_sample_library(root_dir, file_count, seed=0, files_per_dir=50):
+    """Write a fake karaoke library of about file_count files under root_dir, the same for the same seed."""
+    rng = random.Random(seed)
+    artists = make_artists(rng, max(file_count // 15, 10))
+    catalog = {artist: [make_title(rng) for _ in range(rng.randint(3, 25))] for artist in artists}
+    root_dir = Path(root_dir)
+    written = 0
+    dir_index = 0
+    while written < file_count:
+        directory = root_dir / f"Vendor {dir_index % 7}" / f"Disc {dir_index:06d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        dir_index += 1
+        for _ in range(min(files_per_dir, file_count - written)):
+            artist = rng.choice(artists)
+            title = rng.choice(catalog[artist])
+            roll = rng.random()
+            if roll < 0.05:
+                artist = make_typo(rng, artist)
+            elif roll < 0.08:
+                artist, title = title, artist
+            elif roll < 0.1:
+                title = f"{title} {rng.choice(FLAGS)}"
+            stem = make_file_name(rng, artist, title)
+            kind = rng.random()
+            if kind < 0.3:
+                write_zip(directory / f"{stem}.zip", stem, rng)
+                written += 1
+            elif kind < 0.6:
+                (directory / f"{stem}.mp3").write_bytes(rng.randbytes(rng.randint(256, 4096)))
+                (directory / f"{stem}.cdg").write_bytes(bytes(rng.randint(256, 4096)))
+                written += 2
+            else:
+                extension = rng.choice([".mp4", ".avi", ".wmv", ".mpg"])
+                (directory / f"{stem}{extension}").write_bytes(rng.randbytes(rng.randint(256, 8192)))
+                written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a fake karaoke library for trying out and benchmarking fixsongs.py.")
+    parser.add_argument(
+        "root_dir",
+        nargs="?",
+        default="sample-lib",
+        help="Folder to write the library into.",
+    )
+    parser.add_argument(
+        "--files",
+        type=int,
+        default=10000,
+        help="Number of files to generate",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Random seed, the same seed gives the same library",
+    )
+    args = parser.parse_args()
+    written = make_sample_library(args.root_dir, args.files, args.seed)
+    print(f"Wrote {written} files to {os.path.abspath(args.root_dir)}")
+
+
+if __name__ == "__main__":
+    main()
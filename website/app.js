@@ -8,16 +8,57 @@ function normalizeArtist(artist) {
   return theMatch ? `${theMatch[1]}, The` : artist;
 }
 
-// Load the song data
-fetch('songs.json')
-  .then(response => response.json())
-  .then(data => {
-    const songs = processData(data); // Process data once
-    setupSearch(songs); // Pass processed songs to setupSearch
-    setupAlphabetBrowse(data);
-  })
+function fetchJson(url) {
+  return fetch(url).then(response => {
+    if (!response.ok) throw new Error(`${url}: ${response.status}`);
+    return response.json();
+  });
+}
+
+// songs.json is only needed for catalogs written before the search index and letter shards
+let songBookRequest = null;
+function loadSongBook() {
+  songBookRequest = songBookRequest || fetchJson('songs.json');
+  return songBookRequest;
+}
+
+// Load the songs to search, already flattened in search order with their display artist names
+fetchJson('search-index.json')
+  .then(
+    data => {
+      const songs = data.songs.flatMap(([artist, titles]) =>
+        titles.map(title => ({ artist, title, combined: `${artist} ${title}` }))
+      );
+      setupSearch(songs);
+    },
+    error => {
+      console.warn('No search index, searching songs.json:', error);
+      return loadSongBook().then(data => setupSearch(processData(data)));
+    }
+  )
   .catch(error => console.error('Error loading JSON:', error));
 
+// Browse one letter at a time, fetching only the shard of the letter being viewed
+fetchJson('catalog/manifest.json')
+  .then(
+    manifest => letter => {
+      const shard = manifest.letters[letter];
+      return shard ? fetchJson(`catalog/${shard.file}`) : Promise.resolve({});
+    },
+    error => {
+      console.warn('No catalog shards, browsing songs.json:', error);
+      return loadSongBook().then(data => letter => Promise.resolve(artistsByLetter(data, letter)));
+    }
+  )
+  .then(loadLetter => setupAlphabetBrowse(loadLetter))
+  .catch(error => console.error('Error loading JSON:', error));
+
+// Artists of the whole song book that are listed under a letter
+function artistsByLetter(data, letter) {
+  const artists = Object.keys(data).filter(artist => normalizeArtist(artist)[0].toUpperCase() === letter);
+  return Object.fromEntries(artists.map(artist => [artist, data[artist]]));
+}
+
 // Function to process data into a searchable array
 function processData(data) {
   const songs = [];
@@ -118,8 +159,8 @@ function setupSearch(songs) {
 
 
 
-// Set up alphabet browse functionality
-function setupAlphabetBrowse(data) {
+// Set up alphabet browse functionality, loadLetter resolves to the artists and songs under a letter
+function setupAlphabetBrowse(loadLetter) {
   const alphabet = '+0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ'.split('');
   const alphabetDropdown = document.getElementById('alphabetDropdown');
   const artistList = document.getElementById('artistList');
@@ -130,6 +171,8 @@ function setupAlphabetBrowse(data) {
   const paginationControls = document.getElementById('paginationControls')
   const itemsPerPage = getColumnCount() * 7; // Number of artists to display per page
   let currentPage = 1; // Track the current page
+  let currentLetter = null; // Letter being viewed
+  let data = {}; // Artists and songs of the letter being viewed
 
   // Create alphabet dropdown options
   alphabet.forEach(letter => {
@@ -155,13 +198,24 @@ function setupAlphabetBrowse(data) {
 
   // Display artists when a letter is clicked
   function displayArtistsByLetter(letter) {
+    currentLetter = letter;
+    loadLetter(letter)
+      .then(letterData => {
+        if (letter !== currentLetter) return; // Another letter was picked while this one loaded
+        data = letterData;
+        displayLoadedLetter(letter);
+      })
+      .catch(error => console.error(`Error loading artists under ${letter}:`, error));
+  }
+
+  function displayLoadedLetter(letter) {
     artistList.innerHTML = ''; // Clear previous artists
     songList.innerHTML = ''; // Clear previous song lists
     songListHeader.style.display = 'none'; // Hide the song list header
     paginationControls.style.display = 'block';
     artistList.style.display = 'block';
-    // Filter and display artists starting with the selected letter
-    const artists = Object.keys(data).filter(artist => normalizeArtist(artist)[0].toUpperCase() === letter);
+    // Display the artists starting with the selected letter
+    const artists = Object.keys(data);
 
     // Handle if no artists with that letter
     if (artists.length === 0) {